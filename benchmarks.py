@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# Headless benchmarks for Ultra Mario 2D Bros (Sim) and the SMB1 edition.
+# Runs without a window (SDL_VIDEODRIVER=dummy) and prints JSON results:
+#   python benchmarks.py                      # everything, JSON to stdout
+#   python benchmarks.py physics render -o new.json
+#   python benchmarks.py --compare old.json new.json --threshold 0.10
+# In a comparison, metrics ending in _ms/_us are lower-is-better and _per_s
+# higher-is-better; a change worse than the threshold is flagged and the exit
+# status is 1.
+
+import os, sys, time, json, argparse, platform, subprocess, importlib.util
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # keep stdout pure JSON
+
+import pygame
+import ultramario2dbros4k as game
+
+def timeit(fn, frames):
+    fn()  # warm up caches / lazy surfaces
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        fn()
+    return (time.perf_counter() - t0) / frames * 1000.0
+
+# Reference copy of the per-frame background drawing that BackgroundLayers replaced.
+def legacy_draw_background(screen, camera_x):
+    W, H = game.WIDTH, game.HEIGHT
+    top, bottom = game.COL_BG_TOP, game.COL_BG_BOTTOM
+    for y in range(0, H, 4):
+        t = y / H
+        r = int(top[0]*(1-t) + bottom[0]*t)
+        g = int(top[1]*(1-t) + bottom[1]*t)
+        b = int(top[2]*(1-t) + bottom[2]*t)
+        pygame.draw.rect(screen, (r,g,b), (0,y,W,4))
+    offset = (camera_x * 0.3) % 400
+    for i in range(5):
+        x = i*400 - offset
+        pygame.draw.polygon(screen, (96, 165, 250), [(x, H-160), (x+140, H-260), (x+280, H-160)])
+    offset2 = (camera_x * 0.6) % 260
+    for i in range(8):
+        x = int(i*260 - offset2)
+        pygame.draw.circle(screen, (134, 239, 172), (x, H-90), 90)
+
+def bench_background(frames=500):
+    screen = pygame.display.set_mode((game.WIDTH, game.HEIGHT))
+    layers = game.BackgroundLayers()
+    cam = [0.0]
+
+    def before():
+        cam[0] += 3.7
+        legacy_draw_background(screen, cam[0])
+
+    def after():
+        cam[0] += 3.7
+        layers.draw_sky(screen)
+        layers.draw_parallax(screen, cam[0])
+
+    before_ms = timeit(before, frames)
+    after_ms = timeit(after, frames)
+    return {
+        'frames': frames,
+        'before_ms': round(before_ms, 4),
+        'after_ms': round(after_ms, 4),
+        'speedup': round(before_ms / after_ms, 2) if after_ms else None,
+    }
+
+# Reference copy of the per-frame player/exit/spike drawing that SpriteAtlas replaced.
+def legacy_draw_sprites(screen, px, py, ex, spikes):
+    T, w, h = game.TILE, game.PLAYER_W, game.PLAYER_H
+    pygame.draw.rect(screen, game.COL_PLAYER_OUT, (px-2, py-2, w+4, h+4))
+    pygame.draw.rect(screen, game.COL_PLAYER, (px, py, w, h))
+    pygame.draw.rect(screen, (11,18,32), (px+4, py+6, 4, 6))
+    pygame.draw.rect(screen, (11,18,32), (px+w-8, py+6, 4, 6))
+    pygame.draw.rect(screen, (236, 239, 247), (ex + T-6, 100, 4, T*3))
+    pygame.draw.polygon(screen, (251, 191, 36), [(ex + T-2, 106), (ex + T+26, 114), (ex + T-2, 122)])
+    for sx in spikes:
+        game.draw_tile(screen, game.TILE_HAZARD, sx, 400)
+
+def bench_sprites(frames=2000, spikes=12):
+    # one player, one exit and a row of spike tiles per frame
+    screen = pygame.display.set_mode((game.WIDTH, game.HEIGHT))
+    atlas = game.SpriteAtlas()
+    row = [i * game.TILE for i in range(spikes)]
+
+    def before():
+        legacy_draw_sprites(screen, 300, 200, 600, row)
+
+    def after():
+        atlas.draw(screen, 'player', 300, 200)
+        atlas.draw(screen, 'exit', 600, 100)
+        for sx in row:
+            atlas.draw(screen, 'spike', sx, 400)
+
+    before_ms = timeit(before, frames)
+    after_ms = timeit(after, frames)
+    return {
+        'frames': frames,
+        'before_ms': round(before_ms, 4),
+        'after_ms': round(after_ms, 4),
+        'speedup': round(before_ms / after_ms, 2) if after_ms else None,
+    }
+
+def bench_batch(steps=200, sizes=(1, 100, 1000, 10000)):
+    level = game.generate_levels()[10]
+    inputs = game.INPUT_RIGHT | game.INPUT_JUMP
+    results = {}
+    for n in sizes:
+        batch = game.BatchSimulation(level, n)
+        step_ms = timeit(lambda: batch.step(inputs), steps)
+        results[str(n)] = {'step_ms': round(step_ms, 4), 'agent_us': round(step_ms * 1000.0 / n, 4)}
+    return results
+
+def bench_level_cache(repeats=5):
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        game.load_levels(cache_dir=tmp)  # populate
+        generate_ms = timeit(game.generate_levels, repeats)
+        cached_ms = timeit(lambda: game.load_levels(cache_dir=tmp), repeats)
+    return {
+        'generate_ms': round(generate_ms, 3),
+        'cached_load_ms': round(cached_ms, 3),
+        'speedup': round(generate_ms / cached_ms, 1) if cached_ms else None,
+    }
+
+def bench_generation(repeats=5):
+    ms = timeit(game.generate_levels, repeats)
+    return {'levels': game.LEVEL_COUNT, 'set_ms': round(ms, 3),
+            'levels_per_s': round(game.LEVEL_COUNT / ms * 1000.0, 1)}
+
+def bench_generation_numpy(count=10000, difficulty=10):
+    # a seed-search sized run, one level per seed, on each generator backend
+    seeds = range(count)
+
+    def run(generate):
+        t0 = time.perf_counter()
+        for seed in seeds:
+            generate(difficulty, seed)
+        return (time.perf_counter() - t0) * 1000.0
+
+    before_ms = run(game.generate_level)
+    after_ms = run(game.generate_level_numpy)
+    results = {
+        'levels': count,
+        'difficulty': difficulty,
+        'before_ms': round(before_ms, 1),
+        'after_ms': round(after_ms, 1),
+        'speedup': round(before_ms / after_ms, 2) if after_ms else None,
+        'levels_per_s': round(count / after_ms * 1000.0, 1),
+    }
+    smb1 = load_smb1()
+    before_ms = timeit(smb1.generate_smb1_levels, 5)
+    after_ms = timeit(smb1.generate_smb1_levels_numpy, 5)
+    results['smb1'] = {'set_before_ms': round(before_ms, 3), 'set_after_ms': round(after_ms, 3),
+                       'speedup': round(before_ms / after_ms, 2) if after_ms else None}
+    return results
+
+def load_smb1():
+    # The SMB1 edition is a sibling script, not a package; load it by path.
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ultramario2drevampedhdrv0.py")
+    spec = importlib.util.spec_from_file_location("ultramario2drevampedhdrv0", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def bench_smb1_generation(repeats=5):
+    smb1 = load_smb1()
+    count = len(smb1.generate_smb1_levels())
+    ms = timeit(smb1.generate_smb1_levels, repeats)
+    return {'levels': count, 'set_ms': round(ms, 3), 'levels_per_s': round(count / ms * 1000.0, 1)}
+
+def scripted_input(tick):
+    # hold right, hop every 0.6 s (held for 0.23 s) at the physics rate
+    hz = game.PHYSICS_HZ
+    return game.INPUT_RIGHT | (game.INPUT_JUMP if tick % (hz*3//5) < hz*7//30 else 0)
+
+def bench_physics(ticks=3000, repeats=3):
+    inputs = [scripted_input(t) for t in range(ticks)]
+    results = {}
+    total_s = 0.0
+    for level in game.generate_levels():
+        elapsed = float('inf')
+        for _ in range(repeats):  # best of N keeps scheduler noise out of the diff
+            sim = game.Simulation(level)
+            step = sim.step
+            t0 = time.perf_counter()
+            for mask in inputs:
+                step(mask)
+            elapsed = min(elapsed, time.perf_counter() - t0)
+        total_s += elapsed
+        results[str(level.idx)] = {'ticks_per_s': round(ticks / elapsed), 'deaths': sim.deaths}
+    results['all'] = {'ticks_per_s': round(ticks * len(results) / total_s)}
+    return results
+
+def bench_render(frames=200, level_indices=(0, 15, 31), fractions=(0.0, 0.25, 0.5, 1.0), downscale=1):
+    screen = pygame.display.set_mode((game.WIDTH, game.HEIGHT))
+    renderer = game.Renderer(screen, downscale)
+    results = {}
+    for i in level_indices:
+        level = game.generate_level(i)
+        sim = game.Simulation(level)
+        max_cam = max(0, level.width * game.TILE - game.WIDTH)
+        for f in fractions:
+            camera_x = max_cam * f
+            sim.x = camera_x + game.WIDTH / 2
+
+            def frame():
+                renderer.draw_world(level, sim, camera_x, i, game.LEVEL_COUNT, 0)
+                pygame.display.flip()
+
+            results[f"level{i}@{f:.2f}"] = {'frame_ms': round(timeit(frame, frames), 4)}
+    return results
+
+def bench_render_lowres(frames=200):
+    # the same frames with the world drawn at 480x270 and upscaled
+    return bench_render(frames, downscale=2)
+
+BENCHES = {
+    'generation': bench_generation,
+    'smb1_generation': bench_smb1_generation,
+    'generation_numpy': bench_generation_numpy,
+    'physics': bench_physics,
+    'render': bench_render,
+    'render_lowres': bench_render_lowres,
+    'background': bench_background,
+    'sprites': bench_sprites,
+    'batch': bench_batch,
+    'level_cache': bench_level_cache,
+}
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit, 'python': platform.python_version(),
+            'pygame': pygame.version.ver, 'machine': platform.machine()}
+
+def flatten(results, prefix=''):
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, name)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+def compare(base, new, threshold):
+    # Returns a list of (metric, old, new, relative change) slowdowns beyond threshold.
+    old = dict(flatten(base.get('results', base)))
+    slow = []
+    for name, value in flatten(new.get('results', new)):
+        if name not in old or not old[name]:
+            continue
+        if name.endswith(('_ms', '_us')):
+            change = value / old[name] - 1.0
+        elif name.endswith('_per_s'):
+            change = old[name] / value - 1.0 if value else float('inf')
+        else:
+            continue
+        if change > threshold:
+            slow.append((name, old[name], value, change))
+    return slow
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Ultra Mario 2D Bros headless benchmarks")
+    ap.add_argument('names', nargs='*', help=f"benchmarks to run (default: all of {', '.join(BENCHES)})")
+    ap.add_argument('-o', '--output', help="write JSON here instead of stdout")
+    ap.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help="compare two result files")
+    ap.add_argument('--threshold', type=float, default=0.10, help="relative slowdown to flag (default 0.10)")
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        slow = compare(base, new, args.threshold)
+        for name, a, b, change in slow:
+            print(f"SLOWER {name}: {a} -> {b} ({change:+.1%})")
+        if not slow:
+            print(f"no slowdowns beyond {args.threshold:.0%}")
+        return 1 if slow else 0
+
+    unknown = [n for n in args.names if n not in BENCHES]
+    if unknown:
+        ap.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    pygame.init()
+    results = {}
+    for name in args.names or BENCHES:
+        results[name] = BENCHES[name]()
+    pygame.quit()
+    report = {'meta': metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
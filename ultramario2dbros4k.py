@@ -1,10 +1,22 @@
 #!/usr/bin/env python3
 # Ultra Mario 2D Bros (Sim) — Pygame single-file edition
 # One window, one file. No external assets. 32 original procedurally generated levels.
-# Controls: Left/Right to move • Z or Space to jump • R to reset • [ / ] to prev/next level
+# Controls: Left/Right to move • Z or Space to jump • R to reset • [ / ] to prev/next level • F3 frame-time overlay
 # Menu: "ULTRA MARIO 2D BROS — Press Z or Space" (string only; no Nintendo assets are used).
 
-import sys, math, random, pygame
+import os, sys, json, math, mmap, time, random, struct
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # --validate / --replay --headless print JSON to stdout
+try:
+    import pygame
+except ImportError:  # headless use: Level, generate_levels and Simulation need no pygame
+    pygame = None
+try:
+    import numpy as np
+except ImportError:  # only BatchSimulation needs numpy
+    np = None
 
 WIDTH, HEIGHT = 960, 540
 TILE = 32
@@ -13,6 +25,24 @@ MOVE_SPEED = 240.0
 JUMP_VELOCITY = -680.0
 MAX_FALL = 1200.0
 FPS = 60
+LEVEL_COUNT = 32
+MAX_DIFFICULTY = 31
+GENERATOR_VERSION = 1  # bump whenever generate_level() output changes
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".ultra_mario_2d")
+PHYSICS_HZ = 120       # fixed simulation rate, independent of the render frame rate
+SIM_DT = 1.0 / PHYSICS_HZ
+MAX_FRAME_TIME = 0.25  # longest frame fed to the accumulator (avoids a catch-up spiral)
+PLAYER_W, PLAYER_H = 20, 30
+
+# Input bitmask fed to Simulation.step() once per tick
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+
+# Rendering
+CHUNK_COLS = 16        # tile columns per pre-rendered chunk surface
+CHUNK_CACHE_SIZE = 6   # LRU bound on live chunk surfaces (2-3 are visible at once)
+DOWNSCALES = (1, 2, 4) # world framebuffer divisors; each keeps TILE and the parallax periods whole
 
 # Colors
 COL_BG_TOP = (147, 197, 253)
@@ -24,361 +54,765 @@ COL_PLAYER_OUT = (17, 24, 39)
 COL_PLAYER = (34, 211, 238)
 COL_UI = (233, 238, 241)
 COL_UI_PANEL = (0, 0, 0, 160)
+COL_KEY = (255, 0, 255)  # colorkey for transparent chunk pixels
 
 def clamp(a, lo, hi):
     return lo if a < lo else hi if a > hi else a
 
+# Tiles are stored as small integer codes; TILE_FLAGS maps a code to its flag bits.
+TILE_CHARS = ' #XPE'  # code -> map character (P = start marker, E = exit marker)
+TILE_SOLID = 1
+TILE_HAZARD = 2
+TILE_EXIT = 4
+TILE_FLAGS = bytes([0, TILE_SOLID, TILE_HAZARD, 0, TILE_EXIT])
+TILE_ENCODE = bytes(TILE_CHARS.find(chr(c)) % len(TILE_CHARS) for c in range(256))  # unknown -> ' '
+TILE_DECODE = TILE_CHARS.encode('ascii').ljust(256, b' ')
+# code -> b'1' / b'0' for building bitsets with int(..., 2)
+SOLID_BITS = bytes(ord('1') if c < len(TILE_FLAGS) and TILE_FLAGS[c] & TILE_SOLID else ord('0') for c in range(256))
+HAZARD_BITS = bytes(ord('1') if c < len(TILE_FLAGS) and TILE_FLAGS[c] & TILE_HAZARD else ord('0') for c in range(256))
+
 class Level:
-    def __init__(self, idx, width, height, rows, start, exit):
+    def __init__(self, idx, width, height, rows, start, exit, cells=None):
         self.idx = idx
         self.width = width
         self.height = height
-        self.rows = rows  # list[str]
+        if cells is None:
+            cells = ''.join(rows).encode('ascii').translate(TILE_ENCODE)
+        self.cells = cells  # flat row-major bytes of tile codes
         self.start = start  # (x, y) tile coords
         self.exit = exit    # (x, y) tile coords
+        self.span_index = None
+
+    @property
+    def rows(self):
+        # list[str] view for callers that still want text rows
+        w = self.width
+        text = bytes(self.cells).translate(TILE_DECODE).decode('ascii')
+        return [text[y*w:(y+1)*w] for y in range(self.height)]
 
     def tile(self, x, y):
         if y < 0 or y >= self.height or x < 0 or x >= self.width:
             return ' '
-        return self.rows[y][x]
+        return TILE_CHARS[self.cells[y*self.width + x]]
+
+    def flags_at(self, x, y):
+        if y < 0 or y >= self.height or x < 0 or x >= self.width:
+            return 0
+        return TILE_FLAGS[self.cells[y*self.width + x]]
 
     def is_solid(self, x, y):
-        return self.tile(x, y) == '#'
+        return self.flags_at(x, y) & TILE_SOLID != 0
 
     def is_hazard(self, x, y):
-        return self.tile(x, y) == 'X'
+        return self.flags_at(x, y) & TILE_HAZARD != 0
 
-def mulberry_seed(idx):
-    # Deterministic seed per level
-    return 0xC0FFEE + idx * 1337
+    def spans(self):
+        # SpanIndex for this level, built on first use (at level load)
+        if self.span_index is None:
+            self.span_index = SpanIndex(self)
+        return self.span_index
 
-def generate_levels():
-    H = 18
-    MIN_W, MAX_W = 80, 150
-    levels = []
-    for i in range(32):
-        difficulty = i
-        W = min(MIN_W + i*3, MAX_W)
-        rng = random.Random(mulberry_seed(i))
-        # grid as list[list[str]]
-        grid = [[' ' for _ in range(W)] for __ in range(H)]
-        # ground
-        for x in range(W):
-            grid[H-1][x] = '#'
-        # start and end safe runways
-        for x in range(1, 9):
-            grid[H-2][x] = ' '
-            grid[H-1][x] = '#'
-        for x in range(W-10, W-2):
-            grid[H-2][x] = ' '
-            grid[H-1][x] = '#'
-        # place gaps in ground
-        reserved = 10
-        used = []
-        gap_count = min(2 + int(difficulty * 1.2), max(2, W//7))
-        for _ in range(gap_count):
-            tries = 0
-            while tries < 100:
-                tries += 1
-                w = min(2 + difficulty//4 + rng.randint(0,2), 6)
-                x = rng.randint(reserved, W - reserved - w - 1)
-                # avoid overlap
-                conflict = False
-                for gx, gw in used:
-                    if x <= gx + gw + 3 and gx <= x + w + 3:
-                        conflict = True
-                        break
-                if not conflict:
-                    used.append((x, w))
-                    for k in range(w):
-                        grid[H-1][x+k] = ' '  # pit
-                    break
-        # platforms
-        bands = min(2 + difficulty//6, 5)
-        for b in range(bands):
-            y = rng.randint(8, 14 - (b//2))
-            runs = 3 + difficulty//4
-            for r in range(runs):
-                length = rng.randint(3, 8 + difficulty//6)
-                x = rng.randint(6, max(6, W - 6 - length))
-                for k in range(length):
-                    grid[y][x+k] = '#'
-                # occasional spike on top
-                if rng.random() < 0.2 + difficulty*0.01:
-                    sx = x + length//2
-                    if 0 <= y-1 < H: grid[y-1][sx] = 'X'
-        # stairs
-        stair_sets = 1 + difficulty//5
-        for s in range(stair_sets):
-            base_x = rng.randint(14, max(14, W-20))
-            steps = rng.randint(3, 6)
-            for n in range(steps):
-                y = (H-1) - n
-                x = base_x + n
-                if 0 <= x < W and 0 <= y < H:
-                    grid[y][x] = '#'
-        # hazards on ground
-        count = 4 + difficulty*2
-        for _ in range(count):
-            x = rng.randint(12, W-12)
-            if grid[H-1][x] == '#':
-                grid[H-2][x] = 'X'
-                if rng.random() < 0.4 and x+1 < W:
-                    grid[H-2][x+1] = 'X'
-        # start/exit
-        start = (2, H-2)
-        exit = (W-4, H-2)
-        grid[start[1]][start[0]] = 'P'
-        grid[exit[1]][exit[0]] = 'E'
-        rows = [''.join(row) for row in grid]
-        levels.append(Level(i, W, H, rows, start, exit))
-    return levels
+def bitset(codes, bits):
+    # bit i set when codes[i] maps to b'1' in bits
+    text = codes.translate(bits)[::-1]
+    return int(text, 2) if text else 0
 
-def main():
-    pygame.init()
-    pygame.display.set_caption("Ultra Mario 2D Bros (Sim) — Pygame")
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    clock = pygame.time.Clock()
-    font_big = pygame.font.SysFont(None, 64, bold=True)
-    font_mid = pygame.font.SysFont(None, 28, bold=True)
-    font_small = pygame.font.SysFont(None, 20)
-    levels = generate_levels()
+def bit_range(b0, b1):
+    # mask of bits b0 .. b1 inclusive (b0 >= 0)
+    return ((2 << (b1 - b0)) - 1) << b0 if b1 >= b0 else 0
 
-    state = 'menu'   # 'menu' | 'play' | 'clear' | 'end'
-    level_index = 0
-    level = None
-    camera_x = 0.0
-    deaths = 0
+class SpanIndex:
+    # Solid and hazard tiles as bitsets packed into Python ints: bit x of
+    # row_solid[y] and bit y of col_solid[x] are set for a solid tile at (x, y).
+    # A span query is then a shift and a mask instead of one lookup per tile.
+    def __init__(self, level):
+        w, h = level.width, level.height
+        cells = bytes(level.cells)
+        self.row_solid = [bitset(cells[y*w:(y+1)*w], SOLID_BITS) for y in range(h)]
+        self.row_hazard = [bitset(cells[y*w:(y+1)*w], HAZARD_BITS) for y in range(h)]
+        self.col_solid = [bitset(cells[x::w], SOLID_BITS) for x in range(w)]
+        self.col_hazard = [bitset(cells[x::w], HAZARD_BITS) for x in range(w)]
+        self.row_any = [s | z for s, z in zip(self.row_solid, self.row_hazard)]
+        self.col_any = [s | z for s, z in zip(self.col_solid, self.col_hazard)]
 
-    # player dict
-    player = {
-        'x': 0.0, 'y': 0.0, 'w': 20, 'h': 30,
-        'vx': 0.0, 'vy': 0.0,
-        'on_ground': False,
-        'just_jumped': False
-    }
+    def rows_used(self, x0, x1):
+        # (first, last) row holding any solid or hazard tile in columns x0 .. x1, or None
+        bits = 0
+        for c in self.col_any[max(0, x0):x1 + 1]:
+            bits |= c
+        if not bits:
+            return None
+        return (bits & -bits).bit_length() - 1, bits.bit_length() - 1
 
-    def load_level(i):
-        nonlocal level_index, level, camera_x, player
-        level_index = i
-        lvl = levels[i]
-        # clone rows and locate P/E
-        rows = [list(r) for r in lvl.rows]
-        sx, sy = 2, lvl.height-2
-        ex, ey = lvl.width-4, lvl.height-2
-        for y in range(lvl.height):
-            row = rows[y]
-            for x, ch in enumerate(row):
-                if ch == 'P':
-                    sx, sy = x, y
-                    rows[y][x] = ' '
-                elif ch == 'E':
-                    ex, ey = x, y
-                    rows[y][x] = ' '
-        level = Level(lvl.idx, lvl.width, lvl.height, [''.join(r) for r in rows], (sx, sy), (ex, ey))
-        player.update({
-            'x': sx * TILE + 8,
-            'y': sy * TILE - 1,
-            'vx': 0.0, 'vy': 0.0,
-            'on_ground': False,
-            'just_jumped': False
-        })
-        camera_x = max(0.0, player['x'] - WIDTH/2)
-
-    def solid_at(px, py):
+    def tiles_in_row(self, y, x0, x1):
+        # x of every solid or hazard tile in row y between columns x0 and x1
+        bits = (self.row_any[y] & bit_range(max(0, x0), x1)) if 0 <= y < len(self.row_any) else 0
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+def aabb(ax, ay, aw, ah, bx, by, bw, bh):
+    return (ax < bx + bw and ax + aw > bx and ay < by + bh and ay + ah > by)
+
+class Simulation:
+    # Player physics for one Level, advanced by a fixed timestep per step() from an
+    # input bitmask. Pure Python with no pygame use, so it runs without a display.
+    def __init__(self, level, dt=SIM_DT):
+        self.level = level
+        self.cells, self.cols, self.rows = level.cells, level.width, level.height
+        spans = level.spans()
+        self.row_solid, self.col_solid, self.row_hazard = spans.row_solid, spans.col_solid, spans.row_hazard
+        self.dt = dt
+        self.w, self.h = PLAYER_W, PLAYER_H
+        self.restart()
+
+    def restart(self):
+        # a fresh attempt: counters cleared and the player back at the start
+        self.ticks = 0
+        self.deaths = 0
+        self.cleared = False
+        self.reset()
+
+    def reset(self):
+        sx, sy = self.level.start
+        self.x = sx * TILE + 8
+        self.y = sy * TILE - 1
+        self.vx = 0.0
+        self.vy = 0.0
+        self.on_ground = False
+        self.just_jumped = False
+
+    def solid_at(self, px, py):
         tx = int(px // TILE); ty = int(py // TILE)
-        if level is None: return False
-        return level.is_solid(tx, ty)
+        if 0 <= tx < self.cols and 0 <= ty < self.rows:
+            return TILE_FLAGS[self.cells[ty*self.cols + tx]] & TILE_SOLID
+        return 0
 
-    def hazard_at(px, py):
+    def hazard_at(self, px, py):
         tx = int(px // TILE); ty = int(py // TILE)
-        if level is None: return False
-        return level.is_hazard(tx, ty)
-
-    def aabb(ax, ay, aw, ah, bx, by, bw, bh):
-        return (ax < bx + bw and ax + aw > bx and ay < by + bh and ay + ah > by)
-
-    def update_play(dt, keys):
-        nonlocal state, deaths, camera_x
-        # input
-        left = keys[pygame.K_LEFT] or keys[pygame.K_a]
-        right = keys[pygame.K_RIGHT] or keys[pygame.K_d]
-        jump_pressed = keys[pygame.K_z] or keys[pygame.K_SPACE]
-        # level switching and reset
-        if keys[pygame.K_r]:
-            load_level(level_index)
-            return
-        if keys[pygame.K_LEFTBRACKET]:
-            if level_index > 0:
-                load_level(level_index-1)
-            return
-        if keys[pygame.K_RIGHTBRACKET]:
-            if level_index < len(levels)-1:
-                load_level(level_index+1)
-            return
+        if 0 <= tx < self.cols and 0 <= ty < self.rows:
+            return TILE_FLAGS[self.cells[ty*self.cols + tx]] & TILE_HAZARD
+        return 0
+
+    # Box queries over the tiles covering pixel span [a0, a1] along one axis, answered
+    # from the level's SpanIndex bitsets with a shift and a mask. The player's probe
+    # points are less than a tile apart, so testing every covered tile gives the same
+    # answer as the three-probe / four-corner point tests. Tiles off the grid are empty.
+    def solid_in_column(self, tx, y0, y1):
+        if 0 <= tx < self.cols:
+            ty1 = int(y1 // TILE)
+            if ty1 >= 0:
+                ty0 = int(y0 // TILE)
+                if ty0 < 0: ty0 = 0
+                return (self.col_solid[tx] >> ty0) & ((2 << (ty1 - ty0)) - 1)
+        return 0
+
+    def solid_in_row(self, ty, x0, x1):
+        if 0 <= ty < self.rows:
+            tx1 = int(x1 // TILE)
+            if tx1 >= 0:
+                tx0 = int(x0 // TILE)
+                if tx0 < 0: tx0 = 0
+                return (self.row_solid[ty] >> tx0) & ((2 << (tx1 - tx0)) - 1)
+        return 0
+
+    def hazard_in_box(self, x0, y0, x1, y1):
+        tx1 = int(x1 // TILE)
+        if tx1 < 0: return 0
+        tx0 = int(x0 // TILE)
+        if tx0 < 0: tx0 = 0
+        mask = (2 << (tx1 - tx0)) - 1
+        ty = int(y0 // TILE); ty1 = int(y1 // TILE)
+        if ty < 0: ty = 0
+        if ty1 >= self.rows: ty1 = self.rows - 1
+        row_hazard = self.row_hazard
+        while ty <= ty1:
+            if (row_hazard[ty] >> tx0) & mask: return 1
+            ty += 1
+        return 0
+
+    def step(self, inputs, dt=None):
+        # Returns None, 'death' (player already respawned) or 'clear'.
+        if dt is None:
+            dt = self.dt
+        self.ticks += 1
+        left = inputs & INPUT_LEFT
+        right = inputs & INPUT_RIGHT
+        jump_pressed = inputs & INPUT_JUMP
+        w, h = self.w, self.h
 
         # horizontal
         target_vx = (-MOVE_SPEED if left else MOVE_SPEED if right else 0.0)
-        player['vx'] += (target_vx - player['vx']) * min(1.0, dt*10.0)
+        self.vx += (target_vx - self.vx) * min(1.0, dt*10.0)
 
         # gravity
-        player['vy'] += GRAVITY * dt
-        player['vy'] = min(player['vy'], MAX_FALL)
+        self.vy += GRAVITY * dt
+        self.vy = min(self.vy, MAX_FALL)
 
         # jump
-        if jump_pressed and player['on_ground'] and not player['just_jumped']:
-            player['vy'] = JUMP_VELOCITY
-            player['on_ground'] = False
-            player['just_jumped'] = True
+        if jump_pressed and self.on_ground and not self.just_jumped:
+            self.vy = JUMP_VELOCITY
+            self.on_ground = False
+            self.just_jumped = True
         if not jump_pressed:
-            player['just_jumped'] = False
-
-        # move X
-        next_x = player['x'] + player['vx'] * dt
-        if player['vx'] > 0:
-            test_x = next_x + player['w']
-            y1 = player['y'] + 2; y2 = player['y'] + player['h']/2; y3 = player['y'] + player['h'] - 2
-            if solid_at(test_x, y1) or solid_at(test_x, y2) or solid_at(test_x, y3):
-                tile_x = int(test_x // TILE)
-                next_x = tile_x * TILE - player['w'] - 0.01
-                player['vx'] = 0.0
-        elif player['vx'] < 0:
-            test_x = next_x
-            y1 = player['y'] + 2; y2 = player['y'] + player['h']/2; y3 = player['y'] + player['h'] - 2
-            if solid_at(test_x, y1) or solid_at(test_x, y2) or solid_at(test_x, y3):
-                tile_x = int(test_x // TILE) + 1
-                next_x = tile_x * TILE + 0.01
-                player['vx'] = 0.0
-        player['x'] = next_x
+            self.just_jumped = False
 
-        # move Y
-        next_y = player['y'] + player['vy'] * dt
-        player['on_ground'] = False
-        if player['vy'] > 0:
-            test_y = next_y + player['h']
-            x1 = player['x'] + 4; x2 = player['x'] + player['w']/2; x3 = player['x'] + player['w'] - 4
-            if solid_at(x1, test_y) or solid_at(x2, test_y) or solid_at(x3, test_y):
-                tile_y = int(test_y // TILE)
-                next_y = tile_y * TILE - player['h'] - 0.01
-                player['vy'] = 0.0
-                player['on_ground'] = True
-        elif player['vy'] < 0:
-            test_y = next_y
-            x1 = player['x'] + 4; x2 = player['x'] + player['w']/2; x3 = player['x'] + player['w'] - 4
-            if solid_at(x1, test_y) or solid_at(x2, test_y) or solid_at(x3, test_y):
-                tile_y = int(test_y // TILE) + 1
-                next_y = tile_y * TILE + 0.01
-                player['vy'] = 0.0
-        player['y'] = next_y
-
-        # hazards
-        corners = [
-            (player['x']+2, player['y']+2),
-            (player['x']+player['w']-2, player['y']+2),
-            (player['x']+2, player['y']+player['h']-2),
-            (player['x']+player['w']-2, player['y']+player['h']-2),
-        ]
-        for (cx, cy) in corners:
-            if hazard_at(cx, cy):
-                deaths += 1
-                load_level(level_index)
-                return
+        # move X: sweep the leading edge through every column it enters this step
+        # (usually just the destination one), stopping at the first solid column
+        x, y = self.x, self.y
+        next_x = x + self.vx * dt
+        if self.vx > 0:
+            tile_x = int((x + w) // TILE); end = int((next_x + w) // TILE)
+            if tile_x < end: tile_x += 1
+            while tile_x <= end:
+                if self.solid_in_column(tile_x, y + 2, y + h - 2):
+                    next_x = tile_x * TILE - w - 0.01
+                    self.vx = 0.0
+                    break
+                tile_x += 1
+        elif self.vx < 0:
+            tile_x = int(x // TILE); end = int(next_x // TILE)
+            if tile_x > end: tile_x -= 1
+            while tile_x >= end:
+                if self.solid_in_column(tile_x, y + 2, y + h - 2):
+                    next_x = (tile_x + 1) * TILE + 0.01
+                    self.vx = 0.0
+                    break
+                tile_x -= 1
+        self.x = x = next_x
+
+        # move Y: the same sweep over rows, against the x+4 .. x+w-4 span
+        next_y = y + self.vy * dt
+        self.on_ground = False
+        if self.vy > 0:
+            tile_y = int((y + h) // TILE); end = int((next_y + h) // TILE)
+            if tile_y < end: tile_y += 1
+            while tile_y <= end:
+                if self.solid_in_row(tile_y, x + 4, x + w - 4):
+                    next_y = tile_y * TILE - h - 0.01
+                    self.vy = 0.0
+                    self.on_ground = True
+                    break
+                tile_y += 1
+        elif self.vy < 0:
+            tile_y = int(y // TILE); end = int(next_y // TILE)
+            if tile_y > end: tile_y -= 1
+            while tile_y >= end:
+                if self.solid_in_row(tile_y, x + 4, x + w - 4):
+                    next_y = (tile_y + 1) * TILE + 0.01
+                    self.vy = 0.0
+                    break
+                tile_y -= 1
+        self.y = next_y
+
+        # hazards (corners inset by 2px)
+        x, y = self.x, self.y
+        if self.hazard_in_box(x+2, y+2, x+w-2, y+h-2):
+            return self.die()
 
         # fell out
-        if player['y'] > level.height * TILE + 200:
-            deaths += 1
-            load_level(level_index)
-            return
+        if y > self.level.height * TILE + 200:
+            return self.die()
 
         # exit
-        exit_rect = (level.exit[0]*TILE, (level.exit[1]-2)*TILE, TILE, TILE*3)
-        if aabb(player['x'], player['y'], player['w'], player['h'], *exit_rect):
-            if level_index < len(levels)-1:
-                nonlocal_state_set('clear')
+        ex, ey = self.level.exit
+        if aabb(x, y, w, h, ex*TILE, (ey-2)*TILE, TILE, TILE*3):
+            self.cleared = True
+            return 'clear'
+        return None
+
+    def die(self):
+        self.deaths += 1
+        self.reset()
+        return 'death'
+
+def level_grid(level):
+    # uint8 TILE_* flag grid for vectorized lookups
+    codes = np.frombuffer(level.cells, dtype=np.uint8).reshape(level.height, level.width)
+    return np.frombuffer(TILE_FLAGS, dtype=np.uint8)[codes]
+
+class BatchSimulation:
+    # N independent players on the same Level, stepped together with NumPy.
+    # Mirrors Simulation.step() operation for operation, so each agent's state
+    # matches the scalar path bit-for-bit under the same fixed timestep.
+    def __init__(self, level, n, dt=SIM_DT):
+        if np is None:
+            raise RuntimeError("BatchSimulation requires numpy")
+        self.level = level
+        self.n = n
+        self.dt = dt
+        self.w, self.h = PLAYER_W, PLAYER_H
+        self.grid = level_grid(level)
+        # one empty tile of border on every side, flattened, so lookups need no bounds mask
+        self.stride = level.width + 2
+        self.cells = np.pad(self.grid, 1).ravel()
+        self.ticks = 0
+        self.x = np.empty(n); self.y = np.empty(n)
+        self.vx = np.empty(n); self.vy = np.empty(n)
+        self.on_ground = np.zeros(n, dtype=bool)
+        self.just_jumped = np.zeros(n, dtype=bool)
+        self.deaths = np.zeros(n, dtype=np.int64)
+        self.cleared = np.zeros(n, dtype=bool)
+        self.clear_tick = np.full(n, -1, dtype=np.int64)
+        self.reset()
+
+    def reset(self, mask=None):
+        if mask is None:
+            mask = slice(None)
+        sx, sy = self.level.start
+        self.x[mask] = sx * TILE + 8
+        self.y[mask] = sy * TILE - 1
+        self.vx[mask] = 0.0
+        self.vy[mask] = 0.0
+        self.on_ground[mask] = False
+        self.just_jumped[mask] = False
+
+    # TILE is a power of two, so floor(p / TILE) is exact and equals the scalar p // TILE
+    # while being far cheaper than np.floor_divide.
+    def col(self, px):
+        # flat-grid column offset; anything outside the level lands in the empty border
+        return np.clip(np.floor(px / TILE) + 1, 0, self.level.width + 1).astype(np.intp)
+
+    def row(self, py):
+        return np.clip(np.floor(py / TILE) + 1, 0, self.level.height + 1).astype(np.intp) * self.stride
+
+    def tile_col(self, t):
+        return np.clip(t + 1, 0, self.level.width + 1).astype(np.intp)
+
+    def tile_row(self, t):
+        return np.clip(t + 1, 0, self.level.height + 1).astype(np.intp) * self.stride
+
+    def solid(self, col, row):
+        return (self.cells[col + row] & TILE_SOLID) != 0
+
+    def sweep(self, edge, next_edge, forward, backward, offset, across, axis):
+        # Leading-edge tile sweep for one axis. Returns the first solid tile index each
+        # moving agent enters (float) and the hit mask; across holds the flat offsets of
+        # the three probe lines on the other axis, axis 0 = columns, 1 = rows.
+        start = np.floor(edge / TILE)
+        end = np.floor(next_edge / TILE)
+        step = np.where(forward, 1.0, -1.0)
+        start = np.where(forward & (start < end) | backward & (start > end), start + step, end)
+        passes = np.where(forward | backward, np.abs(end - start), -1.0)
+        tile = end.copy()
+        hit = np.zeros(self.n, dtype=bool)
+        for k in range(int(passes.max(initial=-1.0)) + 1):
+            t = start + step * k
+            o = offset(t)
+            found = ~hit & (passes >= k)
+            if axis == 0:
+                found &= self.solid(o, across[0]) | self.solid(o, across[1]) | self.solid(o, across[2])
             else:
-                nonlocal_state_set('end')
+                found &= self.solid(across[0], o) | self.solid(across[1], o) | self.solid(across[2], o)
+            tile = np.where(found, t, tile)
+            hit |= found
+        return tile, hit
 
-        # camera
-        world_w = level.width * TILE
-        camera = player['x'] + player['w']/2 - WIDTH/2
-        camera_x = clamp(camera, 0, max(0, world_w - WIDTH))
+    def hazard(self, col, row):
+        return (self.cells[col + row] & TILE_HAZARD) != 0
+
+    def select(self, index):
+        # keep (or repeat) the agents at index, in that order
+        self.n = len(index)
+        for name in ('x', 'y', 'vx', 'vy', 'on_ground', 'just_jumped', 'deaths', 'cleared', 'clear_tick'):
+            setattr(self, name, getattr(self, name)[index])
+
+    def step(self, inputs, dt=None):
+        # inputs: one bitmask for every agent, or an integer array of length n
+        if dt is None:
+            dt = self.dt
+        self.ticks += 1
+        inputs = np.broadcast_to(np.asarray(inputs, dtype=np.int64), (self.n,))
+        left = (inputs & INPUT_LEFT) != 0
+        right = (inputs & INPUT_RIGHT) != 0
+        jump_pressed = (inputs & INPUT_JUMP) != 0
+        solid, col, row = self.solid, self.col, self.row
+        w, h = self.w, self.h
+
+        # horizontal
+        target_vx = np.where(left, -MOVE_SPEED, np.where(right, MOVE_SPEED, 0.0))
+        self.vx += (target_vx - self.vx) * min(1.0, dt*10.0)
+
+        # gravity
+        self.vy += GRAVITY * dt
+        np.minimum(self.vy, MAX_FALL, out=self.vy)
+
+        # jump
+        jump = jump_pressed & self.on_ground & ~self.just_jumped
+        self.vy[jump] = JUMP_VELOCITY
+        self.on_ground[jump] = False
+        self.just_jumped[jump] = True
+        self.just_jumped[~jump_pressed] = False
+
+        # move X: swept like Simulation.step(); each pass tests the next entered
+        # column for every agent still moving, so most steps take a single pass
+        x, y = self.x, self.y
+        next_x = x + self.vx * dt
+        moving_right = self.vx > 0
+        rows = (row(y + 2), row(y + h/2), row(y + h - 2))
+        tile_x, hit = self.sweep(np.where(moving_right, x + w, x), np.where(moving_right, next_x + w, next_x),
+                                 moving_right, self.vx < 0, lambda t: self.tile_col(t), rows, 0)
+        next_x = np.where(hit & moving_right, tile_x * TILE - w - 0.01, next_x)
+        next_x = np.where(hit & ~moving_right, (tile_x + 1) * TILE + 0.01, next_x)
+        self.vx[hit] = 0.0
+        self.x = x = next_x
+
+        # move Y
+        next_y = y + self.vy * dt
+        self.on_ground[:] = False
+        falling = self.vy > 0
+        cols = (col(x + 4), col(x + w/2), col(x + w - 4))
+        tile_y, hit = self.sweep(np.where(falling, y + h, y), np.where(falling, next_y + h, next_y),
+                                 falling, self.vy < 0, lambda t: self.tile_row(t), cols, 1)
+        next_y = np.where(hit & falling, tile_y * TILE - h - 0.01, next_y)
+        next_y = np.where(hit & ~falling, (tile_y + 1) * TILE + 0.01, next_y)
+        self.vy[hit] = 0.0
+        self.on_ground[hit & falling] = True
+        self.y = next_y
+
+        # hazards (four inset corners) and falling out respawn the agent
+        x, y = self.x, self.y
+        hazard = self.hazard
+        c1, c2 = col(x+2), col(x+w-2)
+        r1, r2 = row(y+2), row(y+h-2)
+        dead = hazard(c1, r1) | hazard(c2, r1) | hazard(c1, r2) | hazard(c2, r2)
+        dead |= y > self.level.height * TILE + 200
+        if dead.any():
+            self.deaths += dead
+            self.reset(dead)
+            x, y = self.x, self.y
+
+        # exit
+        ex, ey = self.level.exit
+        bx, by = ex*TILE, (ey-2)*TILE
+        at_exit = ~dead & (x < bx + TILE) & (x + w > bx) & (y < by + TILE*3) & (y + h > by)
+        self.clear_tick[at_exit & ~self.cleared] = self.ticks
+        self.cleared |= at_exit
+        return at_exit
+
+def draw_tile(surface, flags, px, py):
+    if flags & TILE_SOLID:
+        pygame.draw.rect(surface, COL_BLOCK_DARK, (px, py, TILE, TILE))
+        pygame.draw.rect(surface, COL_BLOCK_LIGHT, (px+2, py+2, TILE-4, TILE-4))
+    elif flags & TILE_HAZARD:
+        spikes = 4
+        for i in range(spikes):
+            sx = px + i*(TILE/spikes)
+            tri = [(sx, py+TILE), (sx + TILE/spikes/2, py+TILE-14), (sx + TILE/spikes, py+TILE)]
+            pygame.draw.polygon(surface, COL_SPIKE, tri)
+
+def draw_player_sprite(surface, px, py):
+    # player box at (px, py) plus its 2 px outline
+    pygame.draw.rect(surface, COL_PLAYER_OUT, (px-2, py-2, PLAYER_W+4, PLAYER_H+4))
+    pygame.draw.rect(surface, COL_PLAYER, (px, py, PLAYER_W, PLAYER_H))
+    # eyes
+    pygame.draw.rect(surface, (11,18,32), (px+4, py+6, 4, 6))
+    pygame.draw.rect(surface, (11,18,32), (px+PLAYER_W-8, py+6, 4, 6))
+
+def draw_exit_sprite(surface, px, py):
+    # pole and flag for an exit whose tile column starts at px, two tiles above py
+    pygame.draw.rect(surface, (236, 239, 247), (px + TILE-6, py, 4, TILE*3))  # pole
+    pygame.draw.polygon(surface, (251, 191, 36), [(px + TILE-2, py+6), (px + TILE-2 + 28, py+14), (px + TILE-2, py+22)])
+
+class SpriteAtlas:
+    # Player, exit and tile sprites drawn once, side by side, onto one colour-keyed
+    # sheet; every draw after that is a blit of a sub-rect. scaled(f) gives a copy of
+    # the sheet resized once (nearest neighbour) for other output resolutions.
+    SPRITES = (  # name, (w, h), offset of the sprite's corner from the draw position, draw
+        ('player', (PLAYER_W+4, PLAYER_H+4), (-2, -2), draw_player_sprite),
+        ('exit', (34, TILE*3), (TILE-6, 0), draw_exit_sprite),
+        ('block', (TILE, TILE), (0, 0), lambda surface, px, py: draw_tile(surface, TILE_SOLID, px, py)),
+        ('spike', (TILE, TILE), (0, 0), lambda surface, px, py: draw_tile(surface, TILE_HAZARD, px, py)),
+    )
 
-    # helper to set outer state from inner scope (Python 3.8 workaround)
-    def nonlocal_state_set(new_state):
-        nonlocal state
-        state = new_state
+    def __init__(self, sheet=None, rects=None, offsets=None, scale=1):
+        if sheet is None:
+            sheet, rects, offsets = self.build()
+        self.sheet, self.rects, self.offsets, self.scale = sheet, rects, offsets, scale
+        self.variants = {scale: self}
 
-    def draw_gradient_background():
-        # simple vertical gradient
+    def build(self):
+        sheet = pygame.Surface((sum(size[0] for _, size, _, _ in self.SPRITES),
+                                max(size[1] for _, size, _, _ in self.SPRITES))).convert()
+        sheet.fill(COL_KEY)
+        sheet.set_colorkey(COL_KEY, pygame.RLEACCEL)
+        rects, offsets = {}, {}
+        x = 0
+        for name, (w, h), (ox, oy), draw in self.SPRITES:
+            draw(sheet, x - ox, -oy)
+            rects[name] = pygame.Rect(x, 0, w, h)
+            offsets[name] = (ox, oy)
+            x += w
+        return sheet, rects, offsets
+
+    def draw(self, surface, name, x, y):
+        ox, oy = self.offsets[name]
+        surface.blit(self.sheet, (x + ox, y + oy), self.rects[name])
+
+    def draw_tile(self, surface, flags, px, py):
+        # occupied tiles only (see SpanIndex.tiles_in_row)
+        self.draw(surface, 'block' if flags & TILE_SOLID else 'spike', px, py)
+
+    def scaled(self, factor):
+        # sheet, rects and offsets all scaled by factor relative to this atlas
+        scale = self.scale * factor
+        variant = self.variants.get(scale)
+        if variant is None:
+            edge = lambda v: max(1, int(round(v * factor)))
+            sizes = {name: (edge(r.w), edge(r.h)) for name, r in self.rects.items()}
+            sheet = pygame.Surface((sum(w for w, h in sizes.values()), max(h for w, h in sizes.values()))).convert()
+            sheet.fill(COL_KEY)
+            sheet.set_colorkey(COL_KEY, pygame.RLEACCEL)
+            rects, x = {}, 0
+            for name, r in self.rects.items():
+                # each sprite on its own, so nearest-neighbour sampling never reaches a neighbour
+                sheet.blit(pygame.transform.scale(self.sheet.subsurface(r), sizes[name]), (x, 0))
+                rects[name] = pygame.Rect((x, 0), sizes[name])
+                x += sizes[name][0]
+            offsets = {name: (int(round(ox * factor)), int(round(oy * factor))) for name, (ox, oy) in self.offsets.items()}
+            variant = SpriteAtlas(sheet, rects, offsets, scale)
+            variant.variants = self.variants
+            self.variants[scale] = variant
+        return variant
+
+class TileChunkCache:
+    # Fixed-width column chunks of a level, drawn once onto off-screen surfaces.
+    # Chunks are built lazily when the camera reaches them and evicted LRU-first.
+    def __init__(self, atlas, cols=CHUNK_COLS, capacity=CHUNK_CACHE_SIZE):
+        self.atlas = atlas  # its scale is the scale chunks are drawn at
+        self.scale = atlas.scale
+        self.tile = int(TILE * atlas.scale)
+        self.cols = cols
+        self.capacity = capacity
+        self.chunks = OrderedDict()  # (level idx, chunk idx) -> (Surface, top y) or None if empty
+
+    def chunk(self, level, ci):
+        key = (level.idx, ci)
+        if key in self.chunks:
+            self.chunks.move_to_end(key)
+            return self.chunks[key]
+        chunk = self.chunks[key] = self.build(level, ci)
+        while len(self.chunks) > self.capacity:
+            self.chunks.popitem(last=False)
+        return chunk
+
+    def build(self, level, ci):
+        # only the band of rows that holds tiles is drawn, visiting occupied tiles only
+        first = ci * self.cols
+        last = min(level.width, first + self.cols) - 1
+        spans = level.spans()
+        used = spans.rows_used(first, last)
+        if used is None:
+            return None
+        top, bottom = used
+        t = self.tile
+        surf = pygame.Surface((self.cols * t, (bottom - top + 1) * t)).convert()
+        surf.fill(COL_KEY)
+        surf.set_colorkey(COL_KEY, pygame.RLEACCEL)
+        for y in range(top, bottom + 1):
+            for tx in spans.tiles_in_row(y, first, last):
+                self.atlas.draw_tile(surf, level.flags_at(tx, y), (tx - first) * t, (y - top) * t)
+        return surf, top * t
+
+    def draw(self, surface, level, camera_x):
+        span = self.cols * TILE
+        first_ci = max(0, int(camera_x // span))
+        last_ci = min((level.width - 1) // self.cols, int((camera_x + WIDTH) // span))
+        for ci in range(first_ci, last_ci + 1):
+            chunk = self.chunk(level, ci)
+            if chunk is not None:
+                surface.blit(chunk[0], (int((ci * span - camera_x) * self.scale), chunk[1]))
+
+class BackgroundLayers:
+    # Sky gradient rendered once, plus mountain and hill strips pre-rendered as
+    # horizontally tileable surfaces; each frame is a handful of wrapped blits.
+    # With scale < 1 all three are shrunk once after drawing, for a smaller target.
+    MOUNTAIN_PERIOD, MOUNTAIN_TOP = 400, HEIGHT-260
+    HILL_PERIOD, HILL_TOP = 260, HEIGHT-180
+
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.sky = pygame.Surface((WIDTH, HEIGHT)).convert()
         for y in range(0, HEIGHT, 4):
             t = y / HEIGHT
             r = int(COL_BG_TOP[0]*(1-t) + COL_BG_BOTTOM[0]*t)
             g = int(COL_BG_TOP[1]*(1-t) + COL_BG_BOTTOM[1]*t)
             b = int(COL_BG_TOP[2]*(1-t) + COL_BG_BOTTOM[2]*t)
-            pygame.draw.rect(screen, (r,g,b), (0,y,WIDTH,4))
-
-    def draw_parallax():
-        # mountains
-        offset = (camera_x * 0.3) % 400
-        col = (96, 165, 250)
-        for i in range(5):
-            x = i*400 - offset
-            points = [(x, HEIGHT-160), (x+140, HEIGHT-260), (x+280, HEIGHT-160)]
-            pygame.draw.polygon(screen, col, points)
-        # hills (near)
-        offset2 = (camera_x * 0.6) % 260
-        col2 = (134, 239, 172)
-        for i in range(8):
-            x = int(i*260 - offset2)
-            pygame.draw.circle(screen, col2, (x, HEIGHT-90), 90)
+            pygame.draw.rect(self.sky, (r,g,b), (0,y,WIDTH,4))
+        self.mountains = self.make_strip(self.MOUNTAIN_PERIOD, HEIGHT-160 - self.MOUNTAIN_TOP + 1,
+                                         self.draw_mountain)
+        self.hills = self.make_strip(self.HILL_PERIOD, HEIGHT - self.HILL_TOP, self.draw_hill)
+        if scale != 1:
+            self.sky, self.mountains, self.hills = (self.shrink(s) for s in (self.sky, self.mountains, self.hills))
+
+    def shrink(self, surface):
+        w, h = surface.get_size()
+        small = pygame.transform.scale(surface, (round(w * self.scale), round(h * self.scale)))
+        if surface.get_colorkey() is not None:
+            small.set_colorkey(COL_KEY, pygame.RLEACCEL)
+        return small
+
+    @staticmethod
+    def make_strip(period, height, draw_one):
+        # smallest whole number of periods so that two blits always cover the screen
+        copies = max(1, math.ceil((WIDTH + period) / 2 / period))
+        strip = pygame.Surface((copies * period, height)).convert()
+        strip.fill(COL_KEY)
+        strip.set_colorkey(COL_KEY, pygame.RLEACCEL)
+        for i in range(-1, copies + 1):  # neighbours bleed in so the seam wraps cleanly
+            draw_one(strip, i * period)
+        return strip
+
+    def draw_mountain(self, strip, x):
+        top = self.MOUNTAIN_TOP
+        points = [(x, HEIGHT-160-top), (x+140, HEIGHT-260-top), (x+280, HEIGHT-160-top)]
+        pygame.draw.polygon(strip, (96, 165, 250), points)
+
+    def draw_hill(self, strip, x):
+        pygame.draw.circle(strip, (134, 239, 172), (x, HEIGHT-90-self.HILL_TOP), 90)
+
+    @staticmethod
+    def blit_wrapped(surface, strip, offset, y):
+        x = -int(offset)
+        w = strip.get_width()
+        while x < surface.get_width():
+            surface.blit(strip, (x, y))
+            x += w
+
+    def draw_sky(self, surface):
+        surface.blit(self.sky, (0, 0))
+
+    def draw_parallax(self, surface, camera_x):
+        s = self.scale
+        self.blit_wrapped(surface, self.mountains, (camera_x * 0.3 * s) % self.mountains.get_width(),
+                          int(self.MOUNTAIN_TOP * s))
+        self.blit_wrapped(surface, self.hills, (camera_x * 0.6 * s) % self.hills.get_width(), int(self.HILL_TOP * s))
+
+def no_mark(phase):
+    pass
+
+class TextCache:
+    # Rendered text surfaces keyed on (font, string, colour), evicted least recently used.
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
 
-    def draw_tiles():
+    def render(self, font, text, colour):
+        key = (font, text, colour)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.surfaces.move_to_end(key)
+            return surf
+        surf = font.render(text, True, colour)
+        self.surfaces[key] = surf
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surf
+
+class RenderState:
+    # Player and camera as drawn: blended between the last two physics states so that
+    # motion stays smooth at any frame rate while physics runs at PHYSICS_HZ.
+    def __init__(self):
+        self.w, self.h = PLAYER_W, PLAYER_H
+        self.x = self.y = self.camera_x = 0.0
+        self.prev = self.cur = (0.0, 0.0, 0.0)
+
+    def snap(self, sim, camera_x):
+        # after a respawn or level load: no blending across the jump
+        self.prev = self.cur = (sim.x, sim.y, camera_x)
+        self.x, self.y, self.camera_x = self.cur
+
+    def push(self, sim, camera_x):
+        self.prev = self.cur
+        self.cur = (sim.x, sim.y, camera_x)
+
+    def blend(self, alpha):
+        (px, py, pc), (cx, cy, cc) = self.prev, self.cur
+        self.x = px + (cx - px) * alpha
+        self.y = py + (cy - py) * alpha
+        self.camera_x = pc + (cc - pc) * alpha
+
+class Renderer:
+    # Draws menu, world and HUD onto one target surface. Owns the fonts and the
+    # pre-rendered tile/background caches; holds no game state of its own.
+    # With downscale > 1 the world (sky to player) is drawn into a framebuffer 1/downscale
+    # the size and upscaled onto the target; HUD, menu and overlays stay full size.
+    def __init__(self, screen, downscale=1, smooth=False):
+        self.screen = screen
+        self.scale = 1.0 / downscale
+        self.frame = screen if downscale == 1 else pygame.Surface((WIDTH // downscale, HEIGHT // downscale)).convert()
+        self.upscale = pygame.transform.smoothscale if smooth else pygame.transform.scale
+        self.font_big = pygame.font.SysFont(None, 64, bold=True)
+        self.font_mid = pygame.font.SysFont(None, 28, bold=True)
+        self.font_small = pygame.font.SysFont(None, 20)
+        self.font_mono = pygame.font.SysFont("monospace", 14)
+        self.atlas = SpriteAtlas()
+        self.world_atlas = self.atlas.scaled(self.scale)
+        self.tile_cache = TileChunkCache(self.world_atlas)
+        self.background = BackgroundLayers(self.scale)
+        self.text = TextCache()
+        self.hud_key = None
+        self.hud = None
+        self.shade = None
+
+    def draw_world(self, level, player, camera_x, level_index, level_count, deaths, mark=no_mark):
+        # one play frame; player is anything with x/y/w/h (a Simulation or RenderState);
+        # mark(phase) is called after each step for the profiler
+        self.draw_gradient_background(); mark('draw_gradient_background')
+        self.draw_parallax(camera_x); mark('draw_parallax')
+        self.draw_tiles(level, camera_x); mark('draw_tiles')
+        self.draw_exit(level, camera_x); mark('draw_exit')
+        self.draw_player(player, camera_x); mark('draw_player')
+        self.present_frame(); mark('upscale')
+        self.draw_hud(level_index, level_count, deaths); mark('draw_hud')
+
+    def draw_gradient_background(self):
+        self.background.draw_sky(self.frame)
+
+    def draw_parallax(self, camera_x):
+        self.background.draw_parallax(self.frame, camera_x)
+
+    def draw_tiles(self, level, camera_x):
         if level is None: return
-        first_tx = max(0, int(camera_x // TILE))
-        last_tx = min(level.width-1, int((camera_x + WIDTH) // TILE) + 1)
-        for y in range(level.height):
-            row = level.rows[y]
-            for tx in range(first_tx, last_tx+1):
-                ch = row[tx]
-                px = tx * TILE - camera_x
-                py = y * TILE
-                if ch == '#':
-                    pygame.draw.rect(screen, COL_BLOCK_DARK, (px, py, TILE, TILE))
-                    pygame.draw.rect(screen, COL_BLOCK_LIGHT, (px+2, py+2, TILE-4, TILE-4))
-                elif ch == 'X':
-                    spikes = 4
-                    base = [(0, TILE)] * spikes  # placeholder
-                    for i in range(spikes):
-                        sx = px + i*(TILE/spikes)
-                        tri = [(sx, py+TILE), (sx + TILE/spikes/2, py+TILE-14), (sx + TILE/spikes, py+TILE)]
-                        pygame.draw.polygon(screen, COL_SPIKE, tri)
-
-    def draw_exit():
+        self.tile_cache.draw(self.frame, level, camera_x)
+
+    def draw_exit(self, level, camera_x):
         if level is None: return
-        px = level.exit[0]*TILE - camera_x
-        py = (level.exit[1]-2)*TILE
-        pygame.draw.rect(screen, (236, 239, 247), (px + TILE-6, py, 4, TILE*3))  # pole
-        pygame.draw.polygon(screen, (251, 191, 36), [(px + TILE-2, py+6), (px + TILE-2 + 28, py+14), (px + TILE-2, py+22)])
-
-    def draw_player():
-        px = int(player['x'] - camera_x)
-        py = int(player['y'])
-        pygame.draw.rect(screen, COL_PLAYER_OUT, (px-2, py-2, player['w']+4, player['h']+4))
-        pygame.draw.rect(screen, COL_PLAYER, (px, py, player['w'], player['h']))
-        # eyes
-        pygame.draw.rect(screen, (11,18,32), (px+4, py+6, 4, 6))
-        pygame.draw.rect(screen, (11,18,32), (px+player['w']-8, py+6, 4, 6))
-
-    def draw_hud():
-        panel = pygame.Surface((220, 70), pygame.SRCALPHA)
-        panel.fill(COL_UI_PANEL)
-        screen.blit(panel, (WIDTH-230, 10))
-        txt1 = font_mid.render(f"Level {level_index+1}/32", True, COL_UI)
-        txt2 = font_mid.render(f"Deaths: {deaths}", True, COL_UI)
-        screen.blit(txt1, (WIDTH-220, 16))
-        screen.blit(txt2, (WIDTH-220, 42))
-
-    def draw_menu():
+        s = self.scale
+        self.world_atlas.draw(self.frame, 'exit', int((level.exit[0]*TILE - camera_x) * s), int((level.exit[1]-2)*TILE * s))
+
+    def draw_player(self, player, camera_x):
+        if player is None: return
+        s = self.scale
+        self.world_atlas.draw(self.frame, 'player', int((player.x - camera_x) * s), int(player.y * s))
+
+    def present_frame(self):
+        if self.frame is not self.screen:
+            self.upscale(self.frame, (WIDTH, HEIGHT), self.screen)
+
+    HUD_RECT = (WIDTH-230, 10, 220, 70)
+    MENU_HILLS_RECT = (0, HEIGHT-180, WIDTH, 161)
+
+    def player_rect(self, player, camera_x):
+        if player is None: return None
+        return (int(player.x - camera_x)-2, int(player.y)-2, player.w+4, player.h+4)
+
+    def draw_hud(self, level_index, level_count, deaths):
+        # the panel is composed once per change of its values, then blitted
+        key = (level_index, level_count, deaths)
+        if key != self.hud_key:
+            self.hud_key = key
+            self.hud = pygame.Surface((220, 70), pygame.SRCALPHA)
+            self.hud.fill(COL_UI_PANEL)
+            # level_count None: endless mode, where level_index is the distance run
+            title = f"Level {level_index+1}/{level_count}" if level_count is not None else f"Distance: {level_index}"
+            self.hud.blit(self.font_mid.render(title, True, COL_UI), (10, 6))
+            self.hud.blit(self.font_mid.render(f"Deaths: {deaths}", True, COL_UI), (10, 32))
+        self.screen.blit(self.hud, (WIDTH-230, 10))
+
+    def draw_menu(self):
+        screen, text = self.screen, self.text
         # sky
         screen.fill(COL_BG_TOP)
         # ground bar
@@ -389,36 +823,1779 @@ def main():
             x = int((i*140 + t) % (WIDTH+160) - 80)
             pygame.draw.circle(screen, (74, 222, 128), (x, HEIGHT-100), 80)
         # title
-        shadow = font_big.render("ULTRA MARIO 2D BROS", True, (11,18,32))
-        title = font_big.render("ULTRA MARIO 2D BROS", True, (255,255,255))
+        shadow = text.render(self.font_big, "ULTRA MARIO 2D BROS", (11,18,32))
+        title = text.render(self.font_big, "ULTRA MARIO 2D BROS", (255,255,255))
         screen.blit(shadow, (WIDTH//2 - shadow.get_width()//2 + 2, 154+2))
         screen.blit(title, (WIDTH//2 - title.get_width()//2, 154))
-        sub = font_mid.render("Press Z or Space to Start", True, (255,255,255))
+        sub = text.render(self.font_mid, "Press Z or Space to Start", (255,255,255))
         screen.blit(sub, (WIDTH//2 - sub.get_width()//2, 210))
-        hint = font_small.render("Arrow keys to move • Z/Space to jump • R to reset", True, (255,255,255))
+        hint = text.render(self.font_small, "Arrow keys to move • Z/Space to jump • R to reset", (255,255,255))
         screen.blit(hint, (WIDTH//2 - hint.get_width()//2, 242))
 
-    def draw_overlay(text1, text2):
-        overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-        overlay.fill((0,0,0,160))
-        screen.blit(overlay, (0,0))
-        a = font_big.render(text1, True, (255,255,255))
-        b = font_mid.render(text2, True, (255,255,255))
+    def draw_overlay(self, text1, text2):
+        screen = self.screen
+        if self.shade is None:
+            self.shade = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+            self.shade.fill((0,0,0,160))
+        screen.blit(self.shade, (0,0))
+        a = self.text.render(self.font_big, text1, (255,255,255))
+        b = self.text.render(self.font_mid, text2, (255,255,255))
         screen.blit(a, (WIDTH//2 - a.get_width()//2, HEIGHT//2 - 22))
         screen.blit(b, (WIDTH//2 - b.get_width()//2, HEIGHT//2 + 18))
 
+class DirtyRects:
+    # Optional present path: repaint and update only the regions that changed, or do a
+    # full redraw and flip when the scene changed or the camera moved at all. Partial
+    # updates therefore only happen while the camera is completely still (menu, overlays,
+    # standing still): the parallax layers scroll at different rates, so any camera
+    # movement changes every pixel of the world and there are no strips to track.
+    def __init__(self):
+        self.scene = None
+        self.camera_x = None
+        self.rects = []
+        self.full = True
+
+    def begin(self, scene, camera_x):
+        # Returns True when this frame must be drawn and presented in full.
+        self.full = scene != self.scene or camera_x != self.camera_x
+        self.scene = scene
+        self.camera_x = camera_x
+        self.rects = []
+        return self.full
+
+    def add(self, rect):
+        if rect is not None:
+            self.rects.append(pygame.Rect(rect))
+
+    def regions(self):
+        # overlapping rects are merged so each area is repainted once
+        merged = []
+        for rect in self.rects:
+            for i, other in enumerate(merged):
+                if rect.colliderect(other):
+                    merged[i] = other.union(rect)
+                    break
+            else:
+                merged.append(rect)
+        self.rects = [r.clip(0, 0, WIDTH, HEIGHT) for r in merged]
+        return self.rects
+
+    def present(self):
+        if self.full:
+            pygame.display.flip()
+        elif self.rects:
+            pygame.display.update(self.rects)
+
+class FrameProfiler:
+    # Per-phase frame timers for the main loop. mark(phase) charges the time since
+    # the previous mark to that phase. When neither the overlay nor a trace is
+    # active every call returns straight away.
+    PHASES = ('input', 'update_play', 'draw_menu', 'draw_gradient_background', 'draw_parallax',
+              'draw_tiles', 'draw_exit', 'draw_player', 'upscale', 'draw_hud', 'draw_overlay', 'profiler', 'display.flip')
+    REFRESH = 15  # frames between overlay percentile refreshes
+
+    def __init__(self, window=240, trace_path=None, overlay=False):
+        self.samples = {name: deque(maxlen=window) for name in self.PHASES}
+        self.overlay = overlay
+        self.trace = None
+        self.frames = 0
+        self.stats = []
+        self.panel = None
+        self.t = 0.0
+        self.current = {}
+        if trace_path:
+            self.open_trace(trace_path)
+        self.enabled = self.overlay or self.trace is not None
+
+    def open_trace(self, path):
+        self.trace_jsonl = path.endswith('.jsonl')
+        self.trace = open(path, 'w', encoding='utf-8', newline='')
+        if not self.trace_jsonl:
+            self.trace.write('frame,' + ','.join(self.PHASES) + '\n')
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.enabled = self.overlay or self.trace is not None
+        for dq in self.samples.values():
+            dq.clear()
+        self.stats = []
+        self.panel = None
+
+    def begin_frame(self):
+        if not self.enabled: return
+        self.current = {}
+        self.t = time.perf_counter()
+
+    def mark(self, phase):
+        if not self.enabled: return
+        now = time.perf_counter()
+        cur = self.current
+        cur[phase] = cur.get(phase, 0.0) + (now - self.t) * 1000.0
+        self.t = now
+
+    def end_frame(self):
+        if not self.enabled: return
+        self.frames += 1
+        cur = self.current
+        for phase, ms in cur.items():
+            self.samples[phase].append(ms)
+        if self.trace is not None:
+            if self.trace_jsonl:
+                self.trace.write(json.dumps({'frame': self.frames, **{k: round(v, 4) for k, v in cur.items()}}) + '\n')
+            else:
+                self.trace.write(f"{self.frames}," + ','.join(
+                    f"{cur[p]:.4f}" if p in cur else '' for p in self.PHASES) + '\n')
+        if self.overlay and self.frames % self.REFRESH == 0:
+            self.stats = [(phase,) + percentiles(dq) for phase, dq in self.samples.items() if dq]
+            self.panel = None
+
+    def rect(self):
+        if not self.overlay or self.panel is None: return None
+        return self.panel.get_rect(topleft=(10, 10))
+
+    def draw(self, surface, font):
+        if not self.overlay or not self.stats: return
+        if self.panel is None:  # re-rendered only when the percentiles refresh
+            line_h = font.get_linesize()
+            self.panel = pygame.Surface((330, line_h * (len(self.stats) + 1) + 8), pygame.SRCALPHA)
+            self.panel.fill((0, 0, 0, 190))
+            self.panel.blit(font.render("phase              p50    p95    p99 ms", True, COL_UI), (6, 4))
+            for i, (phase, p50, p95, p99) in enumerate(self.stats):
+                line = f"{phase:<18}{p50:6.2f} {p95:6.2f} {p99:6.2f}"
+                self.panel.blit(font.render(line, True, COL_UI), (6, 4 + line_h * (i + 1)))
+        surface.blit(self.panel, (10, 10))
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return tuple(ordered[int(round(q * last))] for q in (0.50, 0.95, 0.99))
+
+def mulberry_seed(idx):
+    # Deterministic seed per level
+    return 0xC0FFEE + idx * 1337
+
+def generate_level(i, seed=None):
+    H = 18
+    MIN_W, MAX_W = 80, 150
+    difficulty = min(i, MAX_DIFFICULTY)  # levels past the first 32 vary by seed only
+    W = min(MIN_W + difficulty*3, MAX_W)
+    if seed is None:
+        seed = mulberry_seed(i)
+    rng = random.Random(seed)
+    # grid as list[list[str]]
+    grid = [[' ' for _ in range(W)] for __ in range(H)]
+    # ground
+    for x in range(W):
+        grid[H-1][x] = '#'
+    # start and end safe runways
+    for x in range(1, 9):
+        grid[H-2][x] = ' '
+        grid[H-1][x] = '#'
+    for x in range(W-10, W-2):
+        grid[H-2][x] = ' '
+        grid[H-1][x] = '#'
+    # place gaps in ground
+    reserved = 10
+    used = []
+    gap_count = min(2 + int(difficulty * 1.2), max(2, W//7))
+    for _ in range(gap_count):
+        tries = 0
+        while tries < 100:
+            tries += 1
+            w = min(2 + difficulty//4 + rng.randint(0,2), 6)
+            x = rng.randint(reserved, W - reserved - w - 1)
+            # avoid overlap
+            conflict = False
+            for gx, gw in used:
+                if x <= gx + gw + 3 and gx <= x + w + 3:
+                    conflict = True
+                    break
+            if not conflict:
+                used.append((x, w))
+                for k in range(w):
+                    grid[H-1][x+k] = ' '  # pit
+                break
+    # platforms
+    bands = min(2 + difficulty//6, 5)
+    for b in range(bands):
+        y = rng.randint(8, 14 - (b//2))
+        runs = 3 + difficulty//4
+        for r in range(runs):
+            length = rng.randint(3, 8 + difficulty//6)
+            x = rng.randint(6, max(6, W - 6 - length))
+            for k in range(length):
+                grid[y][x+k] = '#'
+            # occasional spike on top
+            if rng.random() < 0.2 + difficulty*0.01:
+                sx = x + length//2
+                if 0 <= y-1 < H: grid[y-1][sx] = 'X'
+    # stairs
+    stair_sets = 1 + difficulty//5
+    for s in range(stair_sets):
+        base_x = rng.randint(14, max(14, W-20))
+        steps = rng.randint(3, 6)
+        for n in range(steps):
+            y = (H-1) - n
+            x = base_x + n
+            if 0 <= x < W and 0 <= y < H:
+                grid[y][x] = '#'
+    # hazards on ground
+    count = 4 + difficulty*2
+    for _ in range(count):
+        x = rng.randint(12, W-12)
+        if grid[H-1][x] == '#':
+            grid[H-2][x] = 'X'
+            if rng.random() < 0.4 and x+1 < W:
+                grid[H-2][x+1] = 'X'
+    # start/exit are recorded on the Level; the P/E markers carry no collision
+    # flags, so the generated level is playable as-is and never cloned
+    start = (2, H-2)
+    exit = (W-4, H-2)
+    grid[start[1]][start[0]] = 'P'
+    grid[exit[1]][exit[0]] = 'E'
+    rows = [''.join(row) for row in grid]
+    return Level(i, W, H, rows, start, exit)
+
+def generate_levels(count=LEVEL_COUNT):
+    return [generate_level(i) for i in range(count)]
+
+# --- NumPy generator backend ------------------------------------------------------
+# generate_level() again, tile for tile, on a 2-D uint8 array of tile codes: ground,
+# pits and platforms are slice writes, stair diagonals one fancy-indexed write and the
+# ground spikes one masked write. Most of generate_level()'s time goes on randint()
+# inside the gap placement retries, so draws are decoded straight from getrandbits()
+# the way random.Random does it (top k bits of a word, rejected while >= n), which
+# keeps the stream identical, and gap conflicts are a per-width bytearray lookup.
+CODE_BLOCK, CODE_SPIKE, CODE_START, CODE_EXIT = (TILE_CHARS.index(c) for c in '#XPE')
+
+def generate_level_array(i, seed=None):
+    # -> (grid, start, exit) with grid[y, x] the tile code; see level_from_array()
+    if np is None:
+        raise RuntimeError("generate_level_array requires numpy")
+    H = 18
+    MIN_W, MAX_W = 80, 150
+    difficulty = min(i, MAX_DIFFICULTY)
+    W = min(MIN_W + difficulty*3, MAX_W)
+    if seed is None:
+        seed = mulberry_seed(i)
+    rng = random.Random(seed)
+    bits = rng.getrandbits
+
+    def randint(a, b):
+        n = b - a + 1
+        k = n.bit_length()
+        r = bits(k)
+        while r >= n:
+            r = bits(k)
+        return a + r
+
+    grid = np.zeros((H, W), np.uint8)
+    grid[H-1] = CODE_BLOCK  # ground; the start and end runways are left as they are
+    # gaps: per randint(0,2) outcome its width, x range, bits per x draw and the start
+    # columns that would come within 3 tiles of a gap already placed
+    reserved = 10
+    widths = []
+    for r in range(3):
+        w = min(2 + difficulty//4 + r, 6)
+        n = W - 2*reserved - w
+        widths.append((w, n, n.bit_length(), bytearray(W)))
+    gap_count = min(2 + int(difficulty * 1.2), max(2, W//7))
+    for _ in range(gap_count):
+        for _ in range(100):
+            r = bits(2)
+            while r >= 3:
+                r = bits(2)
+            w, n, k, blocked = widths[r]
+            x = bits(k)
+            while x >= n:
+                x = bits(k)
+            x += reserved
+            if not blocked[x]:
+                grid[H-1, x:x+w] = 0  # pit
+                for cw, _, _, other in widths:
+                    lo, hi = max(0, x - cw - 3), min(W, x + w + 4)
+                    other[lo:hi] = b'\1' * (hi - lo)
+                break
+    # platforms, in draw order, since a later run may cover an earlier spike
+    bands = min(2 + difficulty//6, 5)
+    for b in range(bands):
+        y = randint(8, 14 - (b//2))
+        for r in range(3 + difficulty//4):
+            length = randint(3, 8 + difficulty//6)
+            x = randint(6, max(6, W - 6 - length))
+            grid[y, x:x+length] = CODE_BLOCK
+            if rng.random() < 0.2 + difficulty*0.01:
+                grid[y-1, x + length//2] = CODE_SPIKE
+    # stairs
+    for s in range(1 + difficulty//5):
+        base_x = randint(14, max(14, W-20))
+        n = np.arange(randint(3, 6))
+        n = n[base_x + n < W]
+        grid[H-1-n, base_x+n] = CODE_BLOCK
+    # hazards on ground: which draws happen depends on the ground, not on other spikes
+    ground = grid[H-1].tolist()
+    spikes = np.zeros(W, bool)
+    for _ in range(4 + difficulty*2):
+        x = randint(12, W-12)
+        if ground[x] == CODE_BLOCK:
+            spikes[x] = True
+            if rng.random() < 0.4 and x+1 < W:
+                spikes[x+1] = True
+    grid[H-2, spikes] = CODE_SPIKE
+    start = (2, H-2)
+    exit = (W-4, H-2)
+    grid[start[1], start[0]] = CODE_START
+    grid[exit[1], exit[0]] = CODE_EXIT
+    return grid, start, exit
+
+def level_from_array(i, grid, start, exit):
+    H, W = grid.shape
+    return Level(i, W, H, None, start, exit, cells=grid.tobytes())
+
+def generate_level_numpy(i, seed=None):
+    # same Level as generate_level(i, seed), several times faster
+    return level_from_array(i, *generate_level_array(i, seed))
+
+# --- Endless mode -----------------------------------------------------------------
+# Terrain is generated one column at a time just ahead of the camera, with the same
+# gap/platform/stairs/spike rules as generate_level() and the same rates per column,
+# at a difficulty that rises with distance. Only the last ENDLESS_RING_COLS columns
+# are kept, in a ring buffer addressed by world column, so memory stays flat however
+# far the player runs; discarded columns to the left act as a solid wall.
+ENDLESS_RING_COLS = 96   # > one screen of columns + ENDLESS_AHEAD
+ENDLESS_AHEAD = CHUNK_COLS  # columns generated past the screen edge; a whole tile chunk
+ENDLESS_RAMP = 150       # columns per difficulty step
+ENDLESS_WIDTH = 1 << 24  # nominal world width in columns; never reached
+
+def endless_rates(d):
+    # Per-column chances of starting a pit, a platform run (per band), a stair set and
+    # a ground spike, from the counts generate_level() spreads over its usable width.
+    W = min(80 + d*3, 150)
+    # pits: match the pit share of the ground; generate_level()'s random placement jams
+    # at about 3/4 of the tightest packing (pit + 4 spacing columns)
+    w = min(3 + d//4, 6)
+    share = min(min(2 + int(d * 1.2), max(2, W//7)) * w / (W - 20), 0.75 * w / (w + 4))
+    return (min(1.0, 1.0 / max(w / share - w - 4, 1e-9)),
+            (3 + d//4) / (W - 12),
+            (1 + d//5) / (W - 34),
+            1.0 - (1.0 - 1.0 / (W - 23)) ** (4 + d*2))  # chance a column is drawn at least once
+
+ENDLESS_RATES = [endless_rates(d) for d in range(MAX_DIFFICULTY + 1)]
+
+class EndlessLevel:
+    # Level stand-in for endless mode; idx only has to be unique per run (chunk cache key).
+    def __init__(self, seed, idx=-1):
+        H = self.height = 18
+        self.idx = idx
+        self.seed = seed
+        self.width = ENDLESS_WIDTH
+        self.start = (2, H-2)
+        self.exit = (ENDLESS_WIDTH + 2, H-2)
+        self.rng = random.Random(seed)
+        self.ring = bytearray(H * ENDLESS_RING_COLS)  # column-major, world column x at slot x % RING
+        self.col_solid = [0] * ENDLESS_RING_COLS
+        self.col_hazard = [0] * ENDLESS_RING_COLS
+        self.col_any = [0] * ENDLESS_RING_COLS
+        self.first = 0     # oldest world column still held
+        self.end = 0       # next world column to generate
+        self.pending = {}  # world column -> [(row, code)] stamped by features already begun
+        self.gap_left = 0  # pit columns still to come
+        self.gap_gap = 0   # ground columns still required before the next pit
+        self.ensure(WIDTH // TILE + ENDLESS_AHEAD)
+
+    def difficulty(self, x):
+        return min(MAX_DIFFICULTY, x // ENDLESS_RAMP)
+
+    def stamp(self, x, y, code):
+        self.pending.setdefault(x, []).append((y, code))
+
+    def generate_column(self, x):
+        H, rng = self.height, self.rng
+        ground = 1
+        if x >= 10:  # start runway
+            d = self.difficulty(x)
+            gap_p, run_p, stair_p, hazard_p = ENDLESS_RATES[d]
+            # gaps, at least 3 ground tiles apart
+            if self.gap_left:
+                ground = 0
+                self.gap_left -= 1
+            elif self.gap_gap:
+                self.gap_gap -= 1
+            elif rng.random() < gap_p:
+                ground = 0
+                self.gap_left = min(2 + d//4 + rng.randint(0, 2), 6) - 1
+                self.gap_gap = 4
+            # platform runs per band, with the occasional spike on top
+            for b in range(min(2 + d//6, 5)):
+                if rng.random() < run_p:
+                    y = rng.randint(8, 14 - (b//2))
+                    length = rng.randint(3, 8 + d//6)
+                    for k in range(length):
+                        self.stamp(x + k, y, 1)
+                    if rng.random() < 0.2 + d*0.01:
+                        self.stamp(x + length//2, y - 1, 2)
+            # stairs
+            if rng.random() < stair_p:
+                for n in range(rng.randint(3, 6)):
+                    self.stamp(x + n, (H-1) - n, 1)
+            # hazards on ground (rolled for every column, like the per-level count)
+            if rng.random() < hazard_p and ground:
+                self.stamp(x, H-2, 2)
+                if rng.random() < 0.4:
+                    self.stamp(x + 1, H-2, 2)
+        col = bytearray(H)
+        col[H-1] = ground
+        for y, code in self.pending.pop(x, ()):
+            col[y] = code
+        slot = x % ENDLESS_RING_COLS
+        self.ring[slot*H:(slot+1)*H] = col
+        col = bytes(col)
+        solid, hazard = bitset(col, SOLID_BITS), bitset(col, HAZARD_BITS)
+        self.col_solid[slot], self.col_hazard[slot], self.col_any[slot] = solid, hazard, solid | hazard
+        self.end = x + 1
+        self.first = max(0, self.end - ENDLESS_RING_COLS)
+
+    def ensure(self, x_end):
+        while self.end < x_end:
+            self.generate_column(self.end)
+
+    def scroll_to(self, camera_x):
+        # generate up to ENDLESS_AHEAD columns past the right edge of the screen
+        self.ensure(int(camera_x // TILE) + WIDTH // TILE + 1 + ENDLESS_AHEAD)
+
+    def left_edge(self):
+        # leftmost camera x that shows no discarded column
+        return self.first * TILE
+
+    # Column bitsets by world column; discarded columns are a wall, ungenerated ones empty.
+    def solid_column(self, x):
+        if x < self.first: return (1 << self.height) - 1
+        if x >= self.end: return 0
+        return self.col_solid[x % ENDLESS_RING_COLS]
+
+    def hazard_column(self, x):
+        if x < self.first or x >= self.end: return 0
+        return self.col_hazard[x % ENDLESS_RING_COLS]
+
+    def flags_at(self, x, y):
+        if y < 0 or y >= self.height: return 0
+        if x < self.first: return TILE_SOLID
+        if x >= self.end: return 0
+        return TILE_FLAGS[self.ring[(x % ENDLESS_RING_COLS) * self.height + y]]
+
+    def tile(self, x, y):
+        flags = self.flags_at(x, y)
+        return '#' if flags & TILE_SOLID else 'X' if flags & TILE_HAZARD else ' '
+
+    def is_solid(self, x, y):
+        return self.flags_at(x, y) & TILE_SOLID != 0
+
+    def is_hazard(self, x, y):
+        return self.flags_at(x, y) & TILE_HAZARD != 0
+
+    # the two SpanIndex queries the tile chunk cache uses, over the held columns
+    def spans(self):
+        return self
+
+    def rows_used(self, x0, x1):
+        bits = 0
+        for x in range(max(x0, self.first), min(x1, self.end - 1) + 1):
+            bits |= self.col_any[x % ENDLESS_RING_COLS]
+        if not bits:
+            return None
+        return (bits & -bits).bit_length() - 1, bits.bit_length() - 1
+
+    def tiles_in_row(self, y, x0, x1):
+        for x in range(max(x0, self.first), min(x1, self.end - 1) + 1):
+            if self.col_any[x % ENDLESS_RING_COLS] >> y & 1:
+                yield x
+
+class EndlessSimulation(Simulation):
+    # Simulation whose span queries read the EndlessLevel ring by world column.
+    def __init__(self, level, dt=SIM_DT):
+        self.level = level
+        self.rows = level.height
+        self.dt = dt
+        self.w, self.h = PLAYER_W, PLAYER_H
+        self.restart()
+
+    def solid_at(self, px, py):
+        return self.level.flags_at(int(px // TILE), int(py // TILE)) & TILE_SOLID
+
+    def hazard_at(self, px, py):
+        return self.level.flags_at(int(px // TILE), int(py // TILE)) & TILE_HAZARD
+
+    def solid_in_column(self, tx, y0, y1):
+        ty1 = int(y1 // TILE)
+        if ty1 < 0: return 0
+        ty0 = int(y0 // TILE)
+        if ty0 < 0: ty0 = 0
+        return (self.level.solid_column(tx) >> ty0) & ((2 << (ty1 - ty0)) - 1)
+
+    def solid_in_row(self, ty, x0, x1):
+        if 0 <= ty < self.rows:
+            solid_column = self.level.solid_column
+            tx, tx1 = int(x0 // TILE), int(x1 // TILE)
+            while tx <= tx1:
+                if solid_column(tx) >> ty & 1: return 1
+                tx += 1
+        return 0
+
+    def hazard_in_box(self, x0, y0, x1, y1):
+        ty1 = int(y1 // TILE)
+        if ty1 < 0: return 0
+        ty0 = int(y0 // TILE)
+        if ty0 < 0: ty0 = 0
+        mask = (2 << (ty1 - ty0)) - 1
+        hazard_column = self.level.hazard_column
+        tx, tx1 = int(x0 // TILE), int(x1 // TILE)
+        while tx <= tx1:
+            if (hazard_column(tx) >> ty0) & mask: return 1
+            tx += 1
+        return 0
+
+# --- Level cache -------------------------------------------------------------
+# Binary file: header, one index entry per level, then the raw tile-code grids.
+# Keyed on GENERATOR_VERSION (in the header and file name) and each level's seed.
+# Loading memory-maps the file and hands each Level a view into it.
+CACHE_MAGIC = b'UM2DLVL\0'
+CACHE_HEADER = struct.Struct('<8sIII')        # magic, format, generator version, count
+CACHE_ENTRY = struct.Struct('<IQHHHHHHQ')     # idx, seed, w, h, sx, sy, ex, ey, offset
+CACHE_FORMAT = 1
+
+def level_cache_path(cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, f"levels-g{GENERATOR_VERSION}.bin")
+
+def write_level_cache(path, levels):
+    offset = CACHE_HEADER.size + CACHE_ENTRY.size * len(levels)
+    entries = []
+    for lvl in levels:
+        entries.append(CACHE_ENTRY.pack(lvl.idx, mulberry_seed(lvl.idx), lvl.width, lvl.height,
+                                        *lvl.start, *lvl.exit, offset))
+        offset += len(lvl.cells)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_FORMAT, GENERATOR_VERSION, len(levels)))
+        f.writelines(entries)
+        for lvl in levels:
+            f.write(lvl.cells)
+    os.replace(tmp, path)  # readers never see a half-written cache
+
+def open_level_cache(path):
+    # Returns (mmap, level count) for a valid cache file, or None.
+    try:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if mm.size() < CACHE_HEADER.size:
+        return None
+    magic, fmt, gen, n = CACHE_HEADER.unpack_from(mm, 0)
+    if magic != CACHE_MAGIC or fmt != CACHE_FORMAT or gen != GENERATOR_VERSION:
+        return None
+    if mm.size() < CACHE_HEADER.size + n * CACHE_ENTRY.size:
+        return None
+    return mm, n
+
+def cached_level(mm, i):
+    # Level i as a view into the mapped cache, or None if its entry does not check out.
+    idx, seed, w, h, sx, sy, ex, ey, off = CACHE_ENTRY.unpack_from(mm, CACHE_HEADER.size + i * CACHE_ENTRY.size)
+    if idx != i or seed != mulberry_seed(i) or off + w * h > mm.size():
+        return None
+    return Level(idx, w, h, None, (sx, sy), (ex, ey), cells=memoryview(mm)[off:off + w*h])
+
+def read_level_cache(path, count):
+    # Returns the cached levels, or None if the file is missing, stale or short.
+    opened = open_level_cache(path)
+    if opened is None or opened[1] < count:
+        return None
+    mm = opened[0]
+    levels = [cached_level(mm, i) for i in range(count)]
+    return None if None in levels else levels
+
+def generate_levels_parallel(count=LEVEL_COUNT, workers=None):
+    # Same output as generate_levels(); each level only depends on its own seed.
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(generate_level, range(count), chunksize=4))
+
+def load_levels(count=LEVEL_COUNT, cache_dir=None, workers=None):
+    path = level_cache_path(cache_dir)
+    levels = read_level_cache(path, count)
+    if levels is not None:
+        return levels
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1:
+        levels = generate_levels_parallel(count, workers)
+    else:
+        levels = generate_levels(count)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_level_cache(path, levels)
+    except OSError:
+        pass  # read-only home etc.: run uncached
+    return levels
+
+class LevelSequence:
+    # Lazy, indexable stand-in for the list of levels: a Level is read from the cache
+    # or generated on first access, and prefetch() builds upcoming levels on a
+    # background thread so that moving on to them does not stall the frame loop.
+    def __init__(self, count=LEVEL_COUNT, cache_dir=None):
+        self.count = count
+        self.path = level_cache_path(cache_dir)
+        opened = open_level_cache(self.path)
+        self.mm, self.cached = opened if opened is not None else (None, 0)
+        self.levels = {}
+        self.pending = {}  # index -> Future
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="levelgen")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("level index out of range")
+        lvl = self.levels.get(i)
+        if lvl is None:
+            future = self.pending.pop(i, None)
+            lvl = future.result() if future is not None else self.build(i)
+            self.levels[i] = lvl
+        return lvl
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def build(self, i):
+        lvl = cached_level(self.mm, i) if i < self.cached else None
+        return lvl if lvl is not None else generate_level(i)
+
+    def ready(self, i):
+        future = self.pending.get(i)
+        return i in self.levels or (future is not None and future.done())
+
+    def prefetch(self, i):
+        if 0 <= i < self.count and i not in self.levels and i not in self.pending:
+            self.pending[i] = self.pool.submit(self.build, i)
+
+    def save(self):
+        # Extend the on-disk cache when this session built a longer run of levels.
+        n = 0
+        while n < self.count and (n in self.levels or n < self.cached):
+            n += 1
+        if n <= self.cached:
+            return
+        levels = [self[i] for i in range(n)]
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            write_level_cache(self.path, levels)
+        except OSError:
+            pass
+
+    def close(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pool.shutdown(wait=False)
+
+# --- Solvability -----------------------------------------------------------------
+# Breadth-first search over standing states (column, row: the player stands in that
+# row on a solid tile below, and whether it is still running from the last move). A
+# move is a one-tile walk or an airborne arc: a jump, or walking off the edge of a
+# ledge. An arc is an input program: hold one direction, and from a standstill also
+# brake or turn back part-way through. Jumps set off from a few spots across the tile,
+# since some gaps only open from its edge. Arcs are flown once with the real Simulation
+# in empty space and reduced to the tile rectangles the player covers, so they only
+# depend on the physics constants and dt and are shared by every level. Each event's
+# tiles are also packed into a bitmask of a window around the start tile, so ANDing
+# the level's tiles in that window finds the first tile an arc touches. Jumps from the
+# right edge of a tile that the tile to its right also makes from its left edge are
+# left to that tile when it can be walked onto. Touching a hazard rejects an arc, a
+# wall stops the horizontal motion and a ceiling turns the arc into a drop. The move
+# set is fixed, so a level reported unsolvable may still be beatable with frame-precise
+# play; check_validator_search holds the verdicts to search_inputs(), a brute-force
+# search over the real Simulation, on every generated level.
+ARC_TURN_TIME = 0.2   # seconds of flight before braking or turning back
+ARC_RUNWAYS = (0, 2)  # tiles walked before a jump or a drop (more run-up, more speed)
+ARC_OFFSETS = tuple(range(-20, 21, 4))  # px from the tile centre a jump sets off at
+ARC_MAX_TIME = 3.0
+ARC_TABLES = {}  # dt -> flight_arcs() tables
+VALIDATE_POOL_MIN = 64  # validate_levels() checks this many levels or fewer in-process
+ARC_SPACE = Level(-1, 1, 1024, None, (0, 0), (0, 1 << 20), cells=bytes(1024))  # empty space to fly arcs in
+
+def fly_arc(jump, d, runway, program, dt, ledge=True):
+    # ([(x, y, vx, vy) per tick], takeoff tick), in pixels from the corner of tile (0, 0),
+    # where the player stands in the middle after walking `runway` tiles towards d. Without a jump the player walks off the edge of tile (0, 1), or with
+    # ledge=False starts in mid-air moving at full speed towards d. program is ((seconds
+    # after takeoff, direction held from then on), ...), starting at 0; a ledge is walked
+    # off towards d.
+    sim = Simulation(ARC_SPACE, dt=dt)
+    x0, y0 = (TILE - sim.w) / 2, TILE - sim.h - 0.01
+    held = lambda s: INPUT_RIGHT if s > 0 else INPUT_LEFT if s < 0 else 0
+    sim.x, sim.y, sim.on_ground = x0 - d * runway * TILE, y0, True
+    while (x0 - sim.x) * d > 0:  # run-up, holding the player on the floor row
+        sim.step(held(d))
+        sim.y, sim.vy, sim.on_ground = y0, 0.0, True
+    on_ledge = not jump and ledge and d != 0
+    if not jump and not ledge:
+        sim.vx, sim.on_ground = d * MOVE_SPEED, False
+    takeoff = None if on_ledge else 0
+    changes = [(round(at / dt), direction) for at, direction in program]
+    path = []
+    for t in range(round(ARC_MAX_TIME / dt)):
+        direction = d
+        if takeoff is not None:
+            for tick, direction in reversed(changes):
+                if t - takeoff >= tick:
+                    break
+        sim.step((INPUT_JUMP if jump else 0) | held(direction))
+        if takeoff is None:
+            if (sim.x + 4 < TILE) if d > 0 else (sim.x + sim.w - 4 >= 0):
+                sim.y, sim.vy, sim.on_ground = y0, 0.0, True  # the floor probe still finds tile (0, 1)
+            else:
+                takeoff = t
+        path.append((sim.x, sim.y, sim.vx, sim.vy))
+        if sim.y - y0 > 24 * TILE:
+            break
+    return path, takeoff
+
+def arc_events(path, w=PLAYER_W, h=PLAYER_H):
+    # Collapse a path into the ticks where the covered tiles change: body columns,
+    # hazard columns (2px inset), inner columns (4px inset, the floor/ceiling probes),
+    # body rows, the feet row while falling, whether the player is rising and its pace
+    # (vx in quarters of MOVE_SPEED). Each event also records the player's centre column
+    # and its first tick.
+    events = []
+    last = None
+    for t, (ox, oy, vx, vy) in enumerate(path):
+        key = (int(ox // TILE), int((ox + w) // TILE),
+               int((ox + 2) // TILE), int((ox + w - 2) // TILE),
+               int((ox + 4) // TILE), int((ox + w - 4) // TILE),
+               int((oy + 2) // TILE), int((oy + h - 2) // TILE),
+               int((oy + h) // TILE) if vy > 0 else None, vy < 0, round(vx * 4 / MOVE_SPEED))
+        if key != last:
+            events.append(key + (int((ox + w/2) // TILE), t))
+            last = key
+    return events
+
+def tick_index(events, ticks):
+    # event index in effect at each tick, for resuming an arc part-way through
+    index = []
+    for i, ev in enumerate(events):
+        end = events[i+1][-1] if i + 1 < len(events) else ticks
+        index.extend([i] * (end - ev[-1]))
+    return index
+
+def flight_arcs(dt=SIM_DT):
+    # {'jumps'/'drops': {d: [(move name, runway tiles, twin, arc, takeoff tick)]}, 'bumps':
+    #  {direction: arc} (falling from a ceiling), 'rise'/'fall': (arc, tick index) of the
+    #  straight-up jump and the straight drop, 'window': arc_window()}, where an arc is
+    #  (events, arc_cells(events)) and twin is 1 when the tile to the right flies the
+    #  same arc from one of its own offsets when standing still, else 0, and 'reach':
+    #  the most columns one move carries the player past the last one with a solid tile
+    arcs = ARC_TABLES.get(dt)
+    if arcs is None:
+        rise, _ = fly_arc(True, 0, 0, ((0.0, 0),), dt)
+        fall, _ = fly_arc(False, 0, 0, ((0.0, 0),), dt, ledge=False)
+        arcs = {'jumps': {0: [('jump', 0, 0, arc_events(rise), 0)], -1: [], 1: []}, 'drops': {-1: [], 1: []},
+                'bumps': {0: arc_events(fall)}}
+        for d in (-1, 1):
+            side = 'right' if d > 0 else 'left'
+            arcs['bumps'][d] = arc_events(fly_arc(False, d, 0, ((0.0, d),), dt, ledge=False)[0])
+            for runway in ARC_RUNWAYS:
+                for jump in (True, False):
+                    run = f"run{runway}-" if runway else ''
+                    name = (run or 'jump-') + side if jump else run + 'drop-' + side
+                    programs = [(name, ((0.0, d),), True)]
+                    if not runway:
+                        programs.append((f"{name}>back@{ARC_TURN_TIME:g}s", ((0.0, d), (ARC_TURN_TIME, -d)), True))
+                        programs.append((f"{name}>stop@{ARC_TURN_TIME:g}s", ((0.0, d), (ARC_TURN_TIME, 0)), False))
+                    for move, program, shifted in programs:
+                        path, takeoff = fly_arc(jump, d, runway, program, dt)
+                        for offset in (ARC_OFFSETS if jump and shifted else (0,)):
+                            # empty space: an offset start flies the same path, shifted
+                            moved = [(x + offset, y, vx, vy) for x, y, vx, vy in path]
+                            twin = 1 if not runway and offset - TILE in ARC_OFFSETS else 0
+                            arcs['jumps' if jump else 'drops'][d].append((f"{move}{offset:+d}" if offset else move, runway, twin,
+                                                                          arc_events(moved), takeoff))
+        window = arcs['window'] = arc_window([move[3] for kind in ('jumps', 'drops') for moves in arcs[kind].values()
+                                              for move in moves] + list(arcs['bumps'].values()))
+        arc = lambda events: (events, arc_cells(events, window))
+        for kind in ('jumps', 'drops'):
+            for moves in arcs[kind].values():
+                moves[:] = [(name, runway, twin, arc(events), takeoff) for name, runway, twin, events, takeoff in moves]
+        arcs['bumps'] = {d: arc(events) for d, events in arcs['bumps'].items()}
+        arcs['rise'] = (arcs['jumps'][0][0][3], tick_index(arcs['jumps'][0][0][3][0], len(rise)))
+        arcs['fall'] = (arcs['bumps'][0], tick_index(arcs['bumps'][0][0], len(fall)))
+        # columns one move can carry the player past the last solid tile it left: the
+        # farthest floor probe of a falling event, or of a drop after a head bump (which
+        # starts at most one column past the ceiling)
+        far = lambda arcs: max(max(ev[5], -ev[4]) for arc in arcs for ev in arc[0] if ev[8] is not None)
+        arcs['reach'] = max(far([move[3] for kind in ('jumps', 'drops') for moves in arcs[kind].values() for move in moves]),
+                            1 + far(arcs['bumps'].values()))
+        ARC_TABLES[dt] = arcs
+    return arcs
+
+def arc_window(arcs):
+    # (first column, last column, first row, last row) relative to the start tile that
+    # every arc's events stay inside
+    events = [ev for arc in arcs for ev in arc]
+    return (min(min(ev[0], ev[4]) for ev in events), max(max(ev[1], ev[5]) for ev in events),
+            min(ev[6] for ev in events), max(max(ev[7], ev[8] or 0) for ev in events))
+
+def arc_cells(events, window):
+    # (cumulative, single, floor): the tiles each event tests as bits of one int laid
+    # out like validate_level()'s window_bits(), body tiles in the 'anything' plane and
+    # the tiles under the feet in the 'solid' plane. single[k] holds event k's tiles,
+    # floor[k] just those under its feet and cumulative[k] those of events 0..k: ANDed
+    # with a level window they skip the events that touch nothing, and bisecting the
+    # cumulative masks finds the first one that does.
+    c_lo, c_hi, r_lo, r_hi = window
+    rows = r_hi - r_lo + 1
+    plane = (c_hi - c_lo + 1) * rows
+    def rect(c0, c1, r0, r1, at):
+        run = ((1 << (r1 - r0 + 1)) - 1) << (r0 - r_lo + at)
+        return sum(run << (c - c_lo) * rows for c in range(c0, c1 + 1))
+    cumulative, single, floor, mask = [], [], [], 0
+    for bc0, bc1, hc0, hc1, ic0, ic1, r0, r1, feet, rising, pace, centre, t in events:
+        under = rect(ic0, ic1, feet, feet, plane) if feet is not None else 0
+        cells = rect(bc0, bc1, r0, r1, 0) | under
+        mask |= cells
+        single.append(cells)
+        floor.append(under)
+        cumulative.append(mask)
+    return cumulative, single, floor
+
+def bits_in_rect(col_bits, c0, c1, r0, r1):
+    # any set bit in columns c0..c1, rows r0..r1 (off-grid cells are empty)
+    if r1 < 0: return False
+    if r0 < 0: r0 = 0
+    mask = ((2 << (r1 - r0)) - 1) << r0
+    if c0 < 0: c0 = 0
+    if c1 >= len(col_bits): c1 = len(col_bits) - 1
+    while c0 <= c1:
+        if col_bits[c0] & mask: return True
+        c0 += 1
+    return False
+
+def validate_level(level, dt=SIM_DT):
+    # {'level', 'solvable', 'route': [[move, column, row], ...], 'states'}; the route
+    # goes from the start to standing at the exit in as few moves as the breadth-first
+    # search finds (a walk may stand in for a neighbour's jump, so it can be one longer).
+    spans = level.spans()
+    col_solid, col_hazard, col_any = spans.col_solid, spans.col_hazard, spans.col_any
+    W, H = level.width, level.height
+    arcs = flight_arcs(dt)
+    jumps, drops, bumps = arcs['jumps'], arcs['drops'], arcs['bumps']
+
+    def blocked(tx, ty):
+        return bits_in_rect(col_any, tx, tx, ty, ty)
+
+    # bit x of footing[y + 1]: a free tile at (x, y) above a solid one; y runs from -1
+    # (standing on top of the level) to H - 2
+    footing = [spans.row_solid[0]] + [spans.row_solid[y + 1] & ~spans.row_any[y] for y in range(H - 1)]
+
+    def standing(tx, ty):
+        return 0 <= tx < W and -1 <= ty < H - 1 and footing[ty + 1] >> tx & 1 == 1
+
+    c_lo, c_hi, r_lo, r_hi = arcs['window']
+    rows = r_hi - r_lo + 1
+    plane, column = (c_hi - c_lo + 1) * rows, (1 << rows) - 1
+    windows = {}  # (column, row) -> window_bits()
+
+    def window_bits(tx, ty):
+        # the level's tiles around (tx, ty), laid out like arc_cells(): anything solid
+        # or hazardous, then solid only
+        bits, base = 0, ty + r_lo
+        for i, c in enumerate(range(tx + c_lo, tx + c_hi + 1)):
+            if 0 <= c < W:
+                a, s = col_any[c], col_solid[c]
+                if base >= 0:
+                    a, s = a >> base, s >> base
+                else:
+                    a, s = a << -base, s << -base
+                bits |= (a & column) << i * rows | (s & column) << plane + i * rows
+        return bits
+
+    def fly(arc, vertical, tx, ty, takeoff=0, first=None, contacts=4):
+        # Landing (column, row) of an arc from (tx, ty), or None. vertical is the
+        # straight-up/down arc with the same vertical motion from takeoff on, resumed
+        # after a wall stops the player; a head bump continues as a drop from under the
+        # ceiling in the direction the player was heading. Without `first` the search
+        # starts by bisecting for the first event that touches a tile.
+        events, (cumulative, single, floor) = arc
+        bits = windows.get((tx, ty))
+        if bits is None:
+            bits = windows[tx, ty] = window_bits(tx, ty)
+        if first is None:
+            if not bits & cumulative[-1]:
+                return None  # touches nothing: falls out of the level
+            first, hi = 0, len(cumulative) - 1
+            while first < hi:
+                mid = (first + hi) // 2
+                if bits & cumulative[mid]:
+                    hi = mid
+                else:
+                    first = mid + 1
+        for i in range(first, len(events)):
+            if not bits & single[i]:
+                continue
+            bc0, bc1, hc0, hc1, ic0, ic1, r0, r1, feet, rising, pace, centre, t = events[i]
+            if bits & floor[i]:
+                # landed (unless onto spikes); stand on the centre column, or on the
+                # ledge the feet caught
+                if bits_in_rect(col_hazard, tx+hc0, tx+hc1, ty+feet-1, ty+feet-1): return None
+                cx = tx + centre
+                if not bits_in_rect(col_solid, cx, cx, ty+feet, ty+feet):
+                    cx = tx + ic0 if bits_in_rect(col_solid, tx+ic0, tx+ic0, ty+feet, ty+feet) else tx + ic1
+                return cx, ty + feet - 1, (pace > 3) - (pace < -3)
+            # the body touches something
+            if bits_in_rect(col_hazard, tx+hc0, tx+hc1, ty+r0, ty+r1) or not contacts:
+                return None
+            if rising and bits_in_rect(col_solid, tx+ic0, tx+ic1, ty+r0, ty+r0):
+                cx, cy = tx + centre, ty + r0 + 1
+                if blocked(cx, cy): return None
+                return fly(bumps[(pace > 0) - (pace < 0)], arcs['fall'], cx, cy, 0, None, contacts - 1)
+            if bits_in_rect(col_solid, tx+bc0, tx+bc1, ty+r0, ty+r1):
+                # wall: stopped beside it, the vertical motion carries on
+                right = bits_in_rect(col_solid, tx+bc1, tx+bc1, ty+r0, ty+r1)
+                cx = tx + (bc1 - 1 if right else bc0 + 1)
+                v_arc, v_index = vertical
+                tick = t + 1 - takeoff
+                if v_arc is arc or tick < 0 or tick >= len(v_index) or blocked(cx, ty + r0):
+                    return None
+                return fly(v_arc, vertical, cx, ty, 0, v_index[tick], contacts - 1)
+        return None
+
+    landings = {}  # (column, row) -> {move: fly()}; states differing only in run share them
+
+    sx, sy = level.start
+    while sy < H and not standing(sx, sy):
+        sy += 1
+    ex, ey = level.exit
+    start = (sx, sy, 0)
+    parent = {start: None}
+    queue = deque([start])
+    goal = None
+    while queue:
+        tx, ty, run = state = queue.popleft()
+        if tx == ex and ey - 2 <= ty <= ey:
+            goal = state
+            break
+        moves = []
+        here = landings.get((tx, ty))
+        if here is None:
+            here = landings[tx, ty] = {}
+        # tiles of run-up behind the player towards each direction, and whether the
+        # neighbouring tiles can be walked onto (the one to the right then makes the
+        # twin jumps itself)
+        runup, beside = {0: max(ARC_RUNWAYS)}, {0: False}
+        for d in (-1, 1):
+            runup[d] = max(ARC_RUNWAYS) if run == d else \
+                next((k - 1 for k in range(1, max(ARC_RUNWAYS) + 1) if not standing(tx - d*k, ty)), max(ARC_RUNWAYS))
+            beside[d] = standing(tx + d, ty)
+        for d in (-1, 1):
+            if beside[d]:
+                moves.append(('left' if d < 0 else 'right', (tx + d, ty, d if run == d else 0)))
+                continue
+            if blocked(tx + d, ty):
+                continue
+            for name, runway, _, arc, takeoff in drops[d]:
+                if runway <= runup[d]:
+                    if name not in here:
+                        here[name] = fly(arc, arcs['fall'], tx, ty, takeoff)
+                    moves.append((name, here[name]))
+        for d in (0, -1, 1):
+            for name, runway, twin, arc, _ in jumps[d]:
+                if runway <= runup[d] and not beside[twin]:
+                    if name not in here:
+                        here[name] = fly(arc, arcs['rise'], tx, ty)
+                    moves.append((name, here[name]))
+        for name, nxt in moves:
+            if nxt is not None and nxt not in parent and standing(nxt[0], nxt[1]):
+                parent[nxt] = (state, name)
+                queue.append(nxt)
+    route = []
+    state = goal
+    while parent.get(state) is not None:
+        prev, name = parent[state]
+        route.append([name, state[0], state[1]])
+        state = prev
+    route.reverse()
+    return {'level': level.idx, 'solvable': goal is not None, 'route': route, 'states': len(parent)}
+
+def validate_level_index(i):
+    return validate_level(generate_level(i))
+
+def validate_levels(count=LEVEL_COUNT, workers=None):
+    # Validates generated levels 0 .. count-1; workers > 1 spreads them over processes,
+    # each building the arc tables once up front. A level takes a few tens of ms, so up
+    # to VALIDATE_POOL_MIN levels are checked here, where starting the pool would cost
+    # more than it saves.
+    if workers is not None and workers > 1 and count > VALIDATE_POOL_MIN:
+        with ProcessPoolExecutor(max_workers=workers, initializer=flight_arcs) as pool:
+            return list(pool.map(validate_level_index, range(count), chunksize=4))
+    return [validate_level(level) for level in generate_levels(count)]
+
+SEARCH_MASKS = (0, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, INPUT_LEFT | INPUT_JUMP, INPUT_RIGHT | INPUT_JUMP)
+
+def search_inputs(level, hold=4, budget=2_000_000, dt=SIM_DT):
+    # Brute-force counterpart to validate_level(): breadth-first search over the real
+    # physics, trying every input held for `hold` ticks from every reachable state
+    # (airborne states only steer; the jump button does nothing off the ground). States
+    # are merged on a 4px grid with the velocities rounded. Returns (per-tick inputs of
+    # a route that clears the level, or None once the states run out or `budget`
+    # states have been expanded; states expanded). Needs numpy.
+    if np is None:
+        raise RuntimeError("search_inputs requires numpy")
+    sim = BatchSimulation(level, 1, dt)
+    masks = np.array(SEARCH_MASKS, dtype=np.int64)
+    seen, layers, states = set(), [], 0
+    while sim.n and states < budget:
+        states += sim.n
+        tries = np.where(sim.on_ground, len(masks), 3)
+        parent = np.repeat(np.arange(sim.n), tries)
+        inputs = masks[np.arange(len(parent)) - np.repeat(np.cumsum(tries) - tries, tries)]
+        sim.select(parent)
+        for _ in range(hold):
+            sim.step(inputs)
+        alive = np.flatnonzero(sim.deaths == 0)
+        done = alive[sim.cleared[alive]]
+        if len(done):
+            route, i = [], done[0]
+            for parent_of, inputs_of in reversed(layers + [(parent, inputs)]):
+                route.append(int(inputs_of[i]))
+                i = parent_of[i]
+            return [mask for mask in reversed(route) for _ in range(hold)], states
+        air = ~sim.on_ground[alive]
+        x, y, vx, vy = sim.x[alive], sim.y[alive], sim.vx[alive], sim.vy[alive]
+        key = np.floor(x / 4) * 2048 + np.where(air, np.floor(y / 4), np.floor(y / TILE))
+        key = (key * 32 + np.round(vx / 40)) * 64 + np.where(air, np.round(vy / 100), 0)
+        key = key * 4 + air * 2 + (sim.just_jumped[alive] & ~air)
+        codes, first = np.unique(key.astype(np.int64), return_index=True)
+        fresh = np.array([code not in seen for code in codes.tolist()], dtype=bool)
+        seen.update(codes[fresh].tolist())
+        keep = alive[np.sort(first[fresh])]
+        layers.append((parent[keep], inputs[keep]))
+        sim.select(keep)
+    return None, states
+
+# --- Seed search ------------------------------------------------------------------
+# Sweeps seeds for one difficulty and keeps the levels that pass the filters. Workers
+# take whole chunks of seeds and send back only the hits, so the generator and the
+# validator, not pickling, set the pace. Hits stream into an append-only pack file:
+# a header, then tagged records. 'L' holds one level, 'C' marks a finished chunk.
+# A rerun with the same settings skips the finished chunks and carries on. A record
+# torn by an interrupted write is cut off when the pack is reopened.
+PACK_MAGIC = b'UM2DPAK\0'
+PACK_HEADER = struct.Struct('<8sIII')     # magic, format, generator version, settings length
+PACK_LEVEL = struct.Struct('<cQHHHHHH')   # b'L', seed, w, h, sx, sy, ex, ey; then w*h tile codes
+PACK_CHUNK = struct.Struct('<cQI')        # b'C', first seed, seed count
+PACK_FORMAT = 1
+SEARCH_CHUNK = 256
+
+def level_density(level):
+    # (pit columns, hazard tiles) per column of the level
+    cells, w = bytes(level.cells), level.width
+    ground = cells[(level.height - 1) * w:]
+    return ground.count(0) / w, cells.count(TILE_CHARS.index('X')) / w
+
+def crossable(level, dt=SIM_DT):
+    # False when a run of columns without a solid tile between the start and the exit
+    # is too wide for any move to cross: validate_level() can neither land in it nor
+    # carry the player over it, so the level is unsolvable without searching it
+    reach = flight_arcs(dt)['reach']
+    col_solid = level.spans().col_solid
+    lo, hi = sorted((level.start[0], level.exit[0]))
+    last = lo
+    for c in range(lo, hi + 1):
+        if col_solid[c]:
+            if c - last > reach:
+                return False
+            last = c
+    return True
+
+def search_chunk(job):
+    # Worker: one chunk of seeds -> (first seed, count, [(seed, w, h, start, exit, cells)])
+    difficulty, first, count, gaps, spikes = job
+    generate = generate_level_numpy if np is not None else generate_level
+    hits = []
+    for seed in range(first, first + count):
+        level = generate(difficulty, seed)
+        gap, spike = level_density(level)
+        if not (gaps[0] <= gap <= gaps[1] and spikes[0] <= spike <= spikes[1]):
+            continue  # cheap filters before the search
+        if crossable(level) and validate_level(level)['solvable']:
+            hits.append((seed, level.width, level.height, level.start, level.exit, bytes(level.cells)))
+    return first, count, hits
+
+def read_pack(path):
+    # (settings, levels, seeds, finished chunk starts, end of the last finished chunk).
+    # Levels past the last chunk marker belong to an unfinished chunk and are left
+    # out. Raises ValueError when the file is not a pack.
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < PACK_HEADER.size:
+        raise ValueError(f"{path}: not a level pack")
+    magic, fmt, gen, n = PACK_HEADER.unpack_from(data, 0)
+    if magic != PACK_MAGIC or fmt != PACK_FORMAT:
+        raise ValueError(f"{path}: not a level pack")
+    settings = json.loads(data[PACK_HEADER.size:PACK_HEADER.size + n])
+    settings['generator'] = gen
+    levels, seeds, done = [], [], set()
+    pos = end = PACK_HEADER.size + n
+    kept = 0
+    while pos < len(data):
+        tag = data[pos:pos+1]
+        if tag == b'C' and pos + PACK_CHUNK.size <= len(data):
+            done.add(PACK_CHUNK.unpack_from(data, pos)[1])
+            pos = end = pos + PACK_CHUNK.size
+            kept = len(levels)
+        elif tag == b'L' and pos + PACK_LEVEL.size <= len(data):
+            _, seed, w, h, sx, sy, ex, ey = PACK_LEVEL.unpack_from(data, pos)
+            if pos + PACK_LEVEL.size + w * h > len(data):
+                break
+            cells = data[pos + PACK_LEVEL.size:pos + PACK_LEVEL.size + w * h]
+            levels.append(Level(len(levels), w, h, None, (sx, sy), (ex, ey), cells=cells))
+            seeds.append(seed)
+            pos += PACK_LEVEL.size + w * h
+        else:
+            break  # torn record
+    return settings, levels[:kept], seeds[:kept], done, end
+
+def search_seeds(path, difficulty, seeds, first_seed=0, gaps=(0.0, 1.0), spikes=(0.0, 1.0),
+                 workers=None, chunk=SEARCH_CHUNK, log=None):
+    # Appends every passing level among seeds first_seed .. first_seed+seeds-1 to the
+    # pack at path; returns (seeds checked this run, levels found this run).
+    settings = {'difficulty': difficulty, 'first_seed': first_seed, 'chunk': chunk,
+                'gaps': list(gaps), 'spikes': list(spikes)}
+    done = set()
+    if os.path.exists(path):
+        old, _, _, done, end = read_pack(path)
+        if old.pop('generator') != GENERATOR_VERSION or old != settings:
+            raise ValueError(f"{path} was searched with other settings: {old}")
+        with open(path, 'r+b') as f:
+            f.truncate(end)
+    else:
+        blob = json.dumps(settings, sort_keys=True).encode()
+        with open(path, 'wb') as f:
+            f.write(PACK_HEADER.pack(PACK_MAGIC, PACK_FORMAT, GENERATOR_VERSION, len(blob)) + blob)
+    jobs = ((difficulty, start, min(chunk, first_seed + seeds - start), tuple(gaps), tuple(spikes))
+            for start in range(first_seed, first_seed + seeds, chunk) if start not in done)
+    checked = found = 0
+    t0 = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    with open(path, 'ab') as out, ProcessPoolExecutor(max_workers=workers, initializer=flight_arcs) as pool:
+        # a bounded number of chunks in flight keeps memory flat over millions of seeds
+        pending = set()
+        for job in jobs:
+            pending.add(pool.submit(search_chunk, job))
+            if len(pending) < workers * 4:
+                continue
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                checked, found = write_chunk(out, future.result(), checked, found)
+            if log is not None:
+                log(checked, found, time.perf_counter() - t0)
+        for future in pending:
+            checked, found = write_chunk(out, future.result(), checked, found)
+    if log is not None:
+        log(checked, found, time.perf_counter() - t0)
+    return checked, found
+
+def write_chunk(out, result, checked, found):
+    # levels first, then the chunk marker, so a finished chunk never misses a level
+    first, count, hits = result
+    for seed, w, h, (sx, sy), (ex, ey), cells in hits:
+        out.write(PACK_LEVEL.pack(b'L', seed, w, h, sx, sy, ex, ey) + cells)
+    out.write(PACK_CHUNK.pack(b'C', first, count))
+    out.flush()
+    return checked + count, found + len(hits)
+
+# --- Replays -------------------------------------------------------------------
+# A replay is one level attempt: level index, generator seed and version, the fixed
+# timestep, and the per-tick input bitmask stored as (varint run length, mask)
+# pairs. The final player state is kept so that playback can prove it was bit-exact.
+REPLAY_MAGIC = b'UM2R'
+REPLAY_FORMAT = 1
+REPLAY_HEADER = struct.Struct('<4sBHIQdI')  # magic, format, generator version, level, seed, dt, ticks
+REPLAY_RESULT = struct.Struct('<IBdd')      # deaths, cleared, final x, final y
+
+class Replay:
+    def __init__(self, level_index, seed=None, dt=SIM_DT, inputs=None):
+        self.level_index = level_index
+        self.seed = mulberry_seed(level_index) if seed is None else seed
+        self.dt = dt
+        self.inputs = bytearray() if inputs is None else inputs
+        self.result = None  # (deaths, cleared, x, y) once finished
+
+    def record(self, mask):
+        self.inputs.append(mask)
+
+    def finish(self, sim):
+        self.result = (sim.deaths, sim.cleared, sim.x, sim.y)
+
+    def level(self):
+        return generate_level(self.level_index, self.seed)
+
+    def encode(self):
+        out = bytearray(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_FORMAT, GENERATOR_VERSION,
+                                           self.level_index, self.seed, self.dt, len(self.inputs)))
+        deaths, cleared, x, y = self.result or (0, False, 0.0, 0.0)
+        out += REPLAY_RESULT.pack(deaths, cleared, x, y)
+        inputs, i, n = self.inputs, 0, len(self.inputs)
+        while i < n:
+            mask, j = inputs[i], i + 1
+            while j < n and inputs[j] == mask:
+                j += 1
+            run = j - i
+            while run >= 0x80:  # LEB128 run length
+                out.append((run & 0x7F) | 0x80)
+                run >>= 7
+            out.append(run)
+            out.append(mask)
+            i = j
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, data):
+        # Raises ValueError for anything that is not a whole replay of this generator.
+        if len(data) < REPLAY_HEADER.size + REPLAY_RESULT.size:
+            raise ValueError("not a replay file")
+        magic, fmt, gen, level_index, seed, dt, ticks = REPLAY_HEADER.unpack_from(data, 0)
+        if magic != REPLAY_MAGIC or fmt != REPLAY_FORMAT:
+            raise ValueError("not a replay file")
+        if gen != GENERATOR_VERSION:
+            raise ValueError(f"replay was recorded with generator version {gen}, this is {GENERATOR_VERSION}")
+        deaths, cleared, x, y = REPLAY_RESULT.unpack_from(data, REPLAY_HEADER.size)
+        inputs = bytearray()
+        pos = REPLAY_HEADER.size + REPLAY_RESULT.size
+        while len(inputs) < ticks:
+            run = shift = 0
+            while True:
+                if pos >= len(data):
+                    raise ValueError("replay is truncated")
+                b = data[pos]; pos += 1
+                run |= (b & 0x7F) << shift
+                shift += 7
+                if b < 0x80: break
+            if pos >= len(data):
+                raise ValueError("replay is truncated")
+            if len(inputs) + run > ticks:
+                raise ValueError("replay is corrupt: inputs run past the recorded length")
+            inputs += bytes([data[pos]]) * run
+            pos += 1
+        replay = cls(level_index, seed, dt, inputs)
+        replay.result = (deaths, bool(cleared), x, y)
+        return replay
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.encode())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.decode(f.read())
+
+def run_replay(replay):
+    # Headless playback at full speed. Returns the finished Simulation and whether it
+    # reproduced the recorded outcome exactly.
+    sim = Simulation(replay.level(), dt=replay.dt)
+    step = sim.step
+    for mask in replay.inputs:
+        if step(mask) == 'clear':
+            break
+    outcome = (sim.deaths, sim.cleared, sim.x, sim.y)
+    return sim, replay.result is None or outcome == replay.result
+
+def read_input(keys):
+    # pygame key state -> Simulation input bitmask
+    mask = 0
+    if keys[pygame.K_LEFT] or keys[pygame.K_a]: mask |= INPUT_LEFT
+    if keys[pygame.K_RIGHT] or keys[pygame.K_d]: mask |= INPUT_RIGHT
+    if keys[pygame.K_z] or keys[pygame.K_SPACE]: mask |= INPUT_JUMP
+    return mask
+
+def check_reset_allocations(resets=1000):
+    # A death or R-reset must only reinitialise player state: no grid, row or
+    # Level allocation. Peak traced memory across all resets stays far below the
+    # size of one level grid and nothing is retained afterwards.
+    import itertools, tracemalloc
+    level = generate_levels()[31]
+    sim = Simulation(level)
+    tracemalloc.start()
+    sim.reset()  # so the player's own numbers are traced before the baseline
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in itertools.repeat(None, resets):  # no per-iteration int objects
+        sim.reset()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    grid_bytes = level.width * level.height
+    assert after - before <= 0, f"reset retained {after - before} bytes"
+    assert peak - before < grid_bytes // 8, f"reset peaked at {peak - before} bytes"
+    return {'resets': resets, 'retained': after - before, 'peak': peak - before}
+
+def check_level_cache(count=LEVEL_COUNT):
+    # Parallel generation and the mmap cache must reproduce the serial levels byte for byte.
+    import tempfile
+    serial = generate_levels(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        write_level_cache(level_cache_path(tmp), generate_levels_parallel(count, 2))
+        cached = read_level_cache(level_cache_path(tmp), count)
+        assert cached is not None, "cache did not round-trip"
+        for a, b in zip(serial, cached):
+            assert (a.idx, a.width, a.height, a.start, a.exit) == (b.idx, b.width, b.height, b.start, b.exit)
+            assert bytes(a.cells) == bytes(b.cells), f"level {a.idx} differs"
+        del cached  # release the memory map before the directory goes away
+    return {'levels': count}
+
+def check_replay_roundtrip(ticks=3000):
+    # Record scripted play, round-trip it through the file format and replay it headless;
+    # a truncated file is refused.
+    rng = random.Random(7)
+    replay = Replay(5)
+    sim = Simulation(replay.level(), dt=replay.dt)
+    mask = 0
+    for _ in range(ticks):
+        if rng.random() < 0.05:
+            mask = rng.choice((0, INPUT_RIGHT, INPUT_RIGHT | INPUT_JUMP, INPUT_LEFT, INPUT_JUMP))
+        replay.record(mask)
+        if sim.step(mask) == 'clear':
+            break
+    replay.finish(sim)
+    data = replay.encode()
+    copy = Replay.decode(data)
+    assert copy.inputs == replay.inputs, "inputs did not round-trip"
+    _, exact = run_replay(copy)
+    assert exact, "replay diverged from the recording"
+    for cut in range(len(data)):  # every truncation is refused as a ValueError
+        try:
+            Replay.decode(data[:cut])
+        except ValueError:
+            continue
+        raise AssertionError(f"replay cut to {cut} bytes decoded")
+    return {'ticks': len(replay.inputs), 'bytes': len(data), 'deaths': sim.deaths}
+
+def check_batch_parity(agents=16, ticks=400, dts=(SIM_DT, 1.0/30, 0.1)):
+    # BatchSimulation matches one scalar Simulation per agent bit-for-bit on every
+    # generated level, under held random inputs and steps of every dt in dts; needs numpy
+    if np is None:
+        return {'skipped': 'numpy not installed'}
+    rng = random.Random(4)
+    masks = (0, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, INPUT_LEFT | INPUT_JUMP, INPUT_RIGHT | INPUT_JUMP)
+    steps = 0
+    for level in generate_levels():
+        batch = BatchSimulation(level, agents)
+        sims = [Simulation(level) for _ in range(agents)]
+        held = [0] * agents
+        for tick in range(ticks):
+            held = [rng.choice(masks) if rng.random() < 0.1 else m for m in held]
+            dt = rng.choice(dts) if rng.random() < 0.2 else SIM_DT
+            batch.step(np.array(held), dt)
+            for sim, mask in zip(sims, held):
+                sim.step(mask, dt)
+            for name in ('x', 'y', 'vx', 'vy', 'on_ground', 'just_jumped', 'deaths', 'cleared'):
+                want = np.array([getattr(sim, name) for sim in sims])
+                diff = np.flatnonzero(getattr(batch, name) != want)
+                assert not len(diff), f"level {level.idx} agent {diff[0]} tick {tick} (dt {dt:.4f}): {name} " \
+                                      f"{getattr(batch, name)[diff[0]]} != {want[diff[0]]}"
+            steps += agents
+    return {'levels': LEVEL_COUNT, 'steps': steps}
+
+def check_validator():
+    # Hand-built runs: a 3-tile pit is jumpable, a 7-tile one and a spike wall are not,
+    # and crossable() turns down a pit no move spans without searching it.
+    def level(ground, floor=''):
+        W, H = 40, 18
+        rows = [' ' * W] * (H - 2) + [floor.ljust(W), ground.ljust(W, '#')]
+        return Level(-1, W, H, rows, (2, H-2), (W-4, H-2))
+    run = lambda *rows: validate_level(level(*rows))
+    flat, pit3, pit7 = run('#' * 40), run('#' * 18 + ' ' * 3), run('#' * 18 + ' ' * 7)
+    wall = run('#' * 40, ' ' * 18 + 'X' * 12)
+    assert flat['solvable'] and pit3['solvable'], "jumpable level reported unsolvable"
+    assert not pit7['solvable'] and not wall['solvable'], "impossible level reported solvable"
+    reach = flight_arcs()['reach']
+    assert crossable(level('#' * 10 + ' ' * (reach - 1))) and not crossable(level('#' * 10 + ' ' * reach))
+    generated = validate_levels()
+    return {'solvable': sum(r['solvable'] for r in generated), 'levels': len(generated)}
+
+def check_validator_search(count=LEVEL_COUNT):
+    # validate_level() agrees with the brute-force search_inputs() on every generated
+    # level, and each route the search finds clears the level on the scalar Simulation
+    # without a death; needs numpy
+    if np is None:
+        return {'skipped': 'numpy not installed'}
+    solvable = 0
+    for level in generate_levels(count):
+        inputs, states = search_inputs(level)
+        if inputs is not None:
+            sim = Simulation(level)
+            event = next((e for e in map(sim.step, inputs) if e), None)
+            assert event == 'clear', f"level {level.idx}: search route does not replay ({event})"
+        verdict = validate_level(level)['solvable']
+        assert verdict == (inputs is not None), \
+            f"level {level.idx}: validator says {verdict}, search expanded {states} states"
+        solvable += verdict
+    return {'solvable': solvable, 'levels': count}
+
+def check_seed_search(seeds=48, chunk=16):
+    # An interrupted search (torn last record) resumes to the same pack as one pass.
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        whole, cut = os.path.join(tmp, 'whole.pack'), os.path.join(tmp, 'cut.pack')
+        search_seeds(whole, 3, seeds, workers=2, chunk=chunk)
+        search_seeds(cut, 3, seeds - chunk, workers=2, chunk=chunk)
+        with open(cut, 'r+b') as f:
+            f.truncate(os.path.getsize(cut) - 5)
+        search_seeds(cut, 3, seeds, workers=2, chunk=chunk)
+        _, levels, a, done, _ = read_pack(whole)
+        _, _, b, _, _ = read_pack(cut)
+    assert sorted(a) == sorted(b), "resumed search differs from a single pass"
+    assert len(done) == seeds // chunk
+    for seed, level in zip(a, levels):
+        assert bytes(level.cells) == bytes(generate_level(3, seed).cells), f"seed {seed} differs"
+    return {'seeds': seeds, 'levels': len(a)}
+
+def check_endless(columns=3000, ticks=20000):
+    # The ring must hold exactly what was generated for every column still in range,
+    # an EndlessSimulation must move exactly like a Simulation on the same terrain laid
+    # out as a normal Level, and memory must not grow with distance.
+    import tracemalloc
+    ring = EndlessLevel(11)
+    H = ring.height
+    column = lambda x: ''.join(ring.tile(x, y) for y in range(H))
+    columns_seen = [column(x) for x in range(ring.end)]  # the first screen is made up front
+    while ring.end < columns:
+        ring.generate_column(ring.end)
+        columns_seen.append(column(ring.end - 1))
+    for x in range(ring.first, ring.end):
+        assert column(x) == columns_seen[x], f"column {x} differs"
+    assert ring.is_solid(ring.first - 1, 0), "discarded columns must be a wall"
+    flat = Level(-1, columns, H, [''.join(c[y] for c in columns_seen) for y in range(H)],
+                 ring.start, (columns + 2, H-2))
+    endless, sim = EndlessSimulation(EndlessLevel(11)), Simulation(flat)
+    rng = random.Random(3)
+    mask, furthest = INPUT_RIGHT, 0.0
+    ground = ' ' * (H - 1) + '#'
+    for _ in range(ticks):
+        if rng.random() < 0.05:
+            mask = rng.choice((INPUT_RIGHT, INPUT_RIGHT | INPUT_JUMP, INPUT_RIGHT | INPUT_JUMP, INPUT_LEFT))
+        if sim.x < 4 * TILE:
+            mask &= ~INPUT_LEFT  # left of column 0 is a wall in endless mode, open in a Level
+        a, b = endless.step(mask), sim.step(mask)
+        assert (a, endless.x, endless.y) == (b, sim.x, sim.y), f"diverged at tick {endless.ticks}"
+        if a == 'death':
+            # respawn both on open ground at the furthest point reached, so the run covers
+            # the whole strip rather than replaying its first hard gap
+            cx = int(furthest // TILE)
+            while columns_seen[cx] != ground or columns_seen[cx + 1] != ground:
+                cx += 1
+            for m in (endless, sim):
+                m.x, m.y = cx * TILE + 8, (H - 1) * TILE - 1
+        endless.level.scroll_to(clamp(endless.x - WIDTH/2, endless.level.left_edge(), 1e9))
+        furthest = max(furthest, endless.x)
+        if endless.x > (columns - 60) * TILE:
+            break
+    far = EndlessLevel(12)
+    far.ensure(20000)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    far.ensure(220000)  # a flat grid of these columns would be ~4 MB
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert after - before < 16384, f"endless terrain grew by {after - before} bytes"
+    return {'columns': columns, 'furthest': int(furthest // TILE), 'deaths': endless.deaths,
+            'growth': after - before}
+
+def check_numpy_generator(seeds=300):
+    # both backends give the same cells for the seeded levels and for random seeds
+    # at every difficulty; needs numpy
+    if np is None:
+        return {'skipped': 'numpy not installed'}
+    rng = random.Random(5)
+    cases = [(i, None) for i in range(LEVEL_COUNT)]
+    cases += [(rng.randrange(MAX_DIFFICULTY + 1), rng.getrandbits(rng.choice((16, 32, 64)))) for _ in range(seeds)]
+    for i, seed in cases:
+        a, b = generate_level(i, seed), generate_level_numpy(i, seed)
+        assert (bytes(a.cells), a.width, a.start, a.exit) == (bytes(b.cells), b.width, b.start, b.exit), \
+            f"level {i} seed {seed} differs"
+    return {'levels': len(cases)}
+
+def crossed_tiles(a0, a1, size):
+    # tile indices the leading edge of a [a, a+size] span passes into moving a0 -> a1
+    if a1 > a0:
+        return range(int((a0 + size) // TILE) + 1, int((a1 + size) // TILE) + 1)
+    return range(int(a1 // TILE), int(a0 // TILE))
+
+def check_no_tunnelling(ticks=2000, dts=(SIM_DT, 1.0/30, 0.1)):
+    # Fuzz every generated level with random input and long timesteps (at dt=0.1 a
+    # falling player covers several tiles per step): no axis move may pass a solid
+    # tile. Checked by brute force against Level.is_solid, not the resolver's helpers.
+    steps = 0
+    for level in generate_levels():
+        rng = random.Random(level.idx)
+        sim = Simulation(level)
+        w, h = sim.w, sim.h
+        mask = 0
+        for _ in range(ticks):
+            if rng.random() < 0.1:
+                mask = rng.choice((INPUT_RIGHT, INPUT_RIGHT | INPUT_JUMP, INPUT_LEFT | INPUT_JUMP, INPUT_JUMP, 0))
+            x0, y0 = sim.x, sim.y
+            event = sim.step(mask, rng.choice(dts))
+            if event == 'death':
+                continue
+            x1, y1 = sim.x, sim.y
+            rows = range(int((y0 + 2) // TILE), int((y0 + h - 2) // TILE) + 1)
+            for tx in crossed_tiles(x0, x1, w):
+                assert not any(level.is_solid(tx, ty) for ty in rows), \
+                    f"level {level.idx} tick {sim.ticks}: x {x0:.1f} -> {x1:.1f} passed column {tx}"
+            cols = range(int((x1 + 4) // TILE), int((x1 + w - 4) // TILE) + 1)
+            for ty in crossed_tiles(y0, y1, h):
+                assert not any(level.is_solid(tx, ty) for tx in cols), \
+                    f"level {level.idx} tick {sim.ticks}: y {y0:.1f} -> {y1:.1f} passed row {ty}"
+            if event == 'clear':
+                sim.restart()
+            steps += 1
+    return {'levels': LEVEL_COUNT, 'steps': steps}
+
+SELF_CHECKS = {
+    'reset-allocations': check_reset_allocations,
+    'level-cache': check_level_cache,
+    'replay': check_replay_roundtrip,
+    'no-tunnelling': check_no_tunnelling,
+    'batch-parity': check_batch_parity,
+    'validator': check_validator,
+    'validator-vs-search': check_validator_search,
+    'seed-search': check_seed_search,
+    'endless': check_endless,
+    'numpy-generator': check_numpy_generator,
+}
+
+def selfcheck():
+    for name, check in SELF_CHECKS.items():
+        print(name, check())
+
+def main(level_count=LEVEL_COUNT, profile=False, trace_path=None, dirty_rects=False,
+         record_dir=None, replay=None, fps=FPS, endless=False, downscale=1, smooth=False):
+    # The game always draws a WIDTH x HEIGHT canvas; SDL scales it to the window,
+    # which can be resized freely, with the same filtering as the world upscale.
+    os.environ['SDL_RENDER_SCALE_QUALITY'] = 'linear' if smooth else 'nearest'
+    pygame.init()
+    pygame.display.set_caption("Ultra Mario 2D Bros (Sim) — Pygame")
+    screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.RESIZABLE | pygame.SCALED)
+    clock = pygame.time.Clock()
+    renderer = Renderer(screen, downscale, smooth)
+    profiler = FrameProfiler(trace_path=trace_path, overlay=profile)
+    dirty = DirtyRects() if dirty_rects else None
+    if record_dir is not None:
+        os.makedirs(record_dir, exist_ok=True)
+    levels = LevelSequence(level_count)
+    if not endless:
+        levels.prefetch(0)
+
+    state = 'menu'   # 'menu' | 'play' | 'clear' | 'end'
+    level_index = 0
+    level = None
+    camera_x = 0.0
+    deaths = 0
+
+    sim = None
+    view = RenderState()
+    accumulator = 0.0  # unsimulated wall-clock time, consumed in SIM_DT steps
+    recording = None   # Replay being recorded for the current attempt (--record)
+    recorded = 0
+    replay_tick = 0    # next input to feed when playing a replay back
+    runs = 0           # endless mode: runs started, and the best column of this one
+    distance = 0
+
+    def load_level(i):
+        # levels come out of generate_levels() ready to play; nothing is copied here.
+        # In endless mode every call starts a new run on fresh terrain.
+        nonlocal level_index, level, sim, runs, distance
+        save_recording()
+        level_index = i
+        if endless:
+            runs += 1
+            distance = 0
+            level = EndlessLevel(random.getrandbits(32), idx=-runs)
+            sim = EndlessSimulation(level)
+        else:
+            level = levels[i]
+            sim = Simulation(level)
+        restart_level()
+        if not endless:
+            levels.prefetch(i+1)
+
+    def start_replay():
+        nonlocal state, level_index, level, sim, camera_x
+        state = 'play'
+        level_index = replay.level_index
+        level = replay.level()
+        sim = Simulation(level, dt=replay.dt)
+        camera_x = max(0.0, sim.x - WIDTH/2)
+        view.snap(sim, camera_x)
+
+    def save_recording():
+        # one file per attempt: a level load, an R restart, a clear or quitting ends it
+        nonlocal recording, recorded
+        if recording is not None and recording.inputs:
+            recording.finish(sim)
+            recorded += 1
+            name = f"level{recording.level_index+1:03d}-{time.strftime('%Y%m%d-%H%M%S')}-{recorded:04d}.umr"
+            recording.save(os.path.join(record_dir, name))
+        recording = None
+
+    def skip_to_level(i):
+        # [ and ] only switch once the target is built; until then it builds in the background
+        if endless or not 0 <= i < len(levels): return
+        if levels.ready(i):
+            load_level(i)
+        else:
+            levels.prefetch(i)
+
+    def restart_level():
+        nonlocal camera_x, recording, accumulator
+        save_recording()
+        sim.restart()
+        camera_x = max(0.0, sim.x - WIDTH/2)
+        view.snap(sim, camera_x)
+        accumulator = 0.0
+        if record_dir is not None and not endless:
+            recording = Replay(level_index, mulberry_seed(level_index), sim.dt)
+
+    def update_play(frame_s, keys):
+        # Runs as many fixed SIM_DT steps as the elapsed time allows, then blends
+        # the drawn player/camera between the last two steps.
+        nonlocal accumulator
+        if replay is None:
+            # level switching and reset
+            if keys[pygame.K_r]:
+                load_level(0) if endless else restart_level()
+                return
+            if keys[pygame.K_LEFTBRACKET]:
+                skip_to_level(level_index-1)
+                return
+            if keys[pygame.K_RIGHTBRACKET]:
+                skip_to_level(level_index+1)
+                return
+            mask = read_input(keys)
+        accumulator += frame_s
+        while accumulator >= sim.dt and state == 'play':
+            accumulator -= sim.dt
+            step_play(replay_input() if replay is not None else mask)
+        view.blend(accumulator / sim.dt)
+
+    def replay_input():
+        nonlocal state, replay_tick
+        if replay_tick >= len(replay.inputs):
+            state = 'end'
+            return 0
+        replay_tick += 1
+        return replay.inputs[replay_tick - 1]
+
+    def step_play(mask):
+        # one fixed Simulation step; the same inputs always give the same result
+        nonlocal state, deaths, camera_x, distance
+        if state != 'play':
+            return
+        if recording is not None:
+            recording.record(mask)
+        event = sim.step(mask)
+        if event == 'death':
+            deaths += 1
+            if endless:
+                load_level(0)
+        elif event == 'clear':
+            save_recording()
+            if replay is not None or level_index >= len(levels)-1:
+                state = 'end'
+            else:
+                state = 'clear'
+
+        # camera; endless terrain is generated ahead of it and dropped behind it
+        world_w = level.width * TILE
+        camera = sim.x + sim.w/2 - WIDTH/2
+        camera_x = clamp(camera, level.left_edge() if endless else 0, max(0, world_w - WIDTH))
+        if endless:
+            level.scroll_to(camera_x)
+            distance = max(distance, int(sim.x // TILE))
+        if event == 'death':
+            view.snap(sim, camera_x)
+        else:
+            view.push(sim, camera_x)
+
+    def draw_scene():
+        if state == 'menu':
+            renderer.draw_menu()
+            mark('draw_menu')
+        else:
+            renderer.draw_world(level, view, view.camera_x, *hud_values(), deaths, mark)
+            if state == 'clear':
+                renderer.draw_overlay("Course Clear!", "Press Z or Space for the next level")
+                mark('draw_overlay')
+            elif state == 'end' and replay is not None:
+                outcome = "cleared" if sim.cleared else "not cleared"
+                renderer.draw_overlay("Replay finished", f"{outcome} • {sim.deaths} deaths • {sim.ticks} ticks")
+                mark('draw_overlay')
+            elif state == 'end':
+                renderer.draw_overlay("The End — Thanks for playing!", "")
+                mark('draw_overlay')
+        profiler.draw(screen, renderer.font_mono)
+        mark('profiler')
+
+    def hud_values():
+        return (distance, None) if endless else (level_index, len(levels))
+
+    last_player_rect = None
+    last_hud = None
+
+    def mark_dirty_regions():
+        # what can change while the camera holds still: the player, the HUD values,
+        # the menu's rolling hills and the profiler panel; overlays are static
+        if state == 'menu':
+            dirty.add(renderer.MENU_HILLS_RECT)
+        elif state == 'play':
+            rect = renderer.player_rect(view, view.camera_x)
+            if rect != last_player_rect:
+                dirty.add(rect)
+                dirty.add(last_player_rect)
+            hud = (*hud_values(), deaths)
+            if hud != last_hud:
+                dirty.add(renderer.HUD_RECT)
+        dirty.add(profiler.rect())
+
+    def remember_dirty_state():
+        nonlocal last_player_rect, last_hud
+        last_player_rect = renderer.player_rect(view, view.camera_x) if state == 'play' else None
+        last_hud = (*hud_values(), deaths)
+
     # initial
     camera_x = 0.0
 
+    if replay is not None:
+        start_replay()
+
     running = True
+    mark = profiler.mark
     while running:
-        dt = min(0.033, clock.tick(FPS) / 1000.0)
+        frame_s = min(MAX_FRAME_TIME, clock.tick(fps) / 1000.0)
+        profiler.begin_frame()
         keys = pygame.key.get_pressed()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.KEYDOWN:
-                if state == 'menu' and (event.key in (pygame.K_z, pygame.K_SPACE)):
+                if event.key == pygame.K_F3:
+                    profiler.toggle_overlay()
+                elif state == 'menu' and (event.key in (pygame.K_z, pygame.K_SPACE)):
                     load_level(0)
                     state = 'play'
                 elif state == 'clear' and (event.key in (pygame.K_z, pygame.K_SPACE)):
@@ -427,29 +2604,111 @@ def main():
                         state = 'play'
                     else:
                         state = 'end'
+        mark('input')
 
         if state == 'play':
-            update_play(dt, keys)
+            update_play(frame_s, keys)
+            mark('update_play')
 
         # draw
-        if state == 'menu':
-            draw_menu()
+        if dirty is None:
+            draw_scene()
+            pygame.display.flip()
         else:
-            draw_gradient_background()
-            draw_parallax()
-            draw_tiles()
-            draw_exit()
-            draw_player()
-            draw_hud()
-            if state == 'clear':
-                draw_overlay("Course Clear!", "Press Z or Space for the next level")
-            elif state == 'end':
-                draw_overlay("The End — Thanks for playing!", "")
-
-        pygame.display.flip()
+            if dirty.begin((state, level_index, profiler.overlay), view.camera_x):
+                draw_scene()
+            else:
+                mark_dirty_regions()
+                for rect in dirty.regions():
+                    screen.set_clip(rect)
+                    draw_scene()
+                screen.set_clip(None)
+            dirty.present()
+            remember_dirty_state()
+        mark('display.flip')
+        profiler.end_frame()
 
+    save_recording()
+    profiler.close()
+    levels.save()
+    levels.close()
     pygame.quit()
     sys.exit()
 
+def positive_int(text):
+    # argparse type for counts of at least 1
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+def density_range(text):
+    # argparse type for MIN:MAX
+    lo, _, hi = text.partition(':')
+    return float(lo or 0.0), float(hi or 1.0)
+
 if __name__ == "__main__":
-    main()
+    import argparse
+    ap = argparse.ArgumentParser(description="Ultra Mario 2D Bros (Sim)")
+    ap.add_argument('--levels', type=positive_int, default=LEVEL_COUNT, help="number of seeded levels")
+    ap.add_argument('--endless', action='store_true', help="one endless run on terrain generated as you go")
+    ap.add_argument('--profile', action='store_true', help="start with the frame-time overlay shown (toggle: F3)")
+    ap.add_argument('--trace', metavar='FILE', help="write per-frame phase timings to FILE (.csv or .jsonl)")
+    ap.add_argument('--dirty-rects', action='store_true',
+                    help="update only changed screen regions while the camera is still")
+    ap.add_argument('--downscale', type=int, choices=DOWNSCALES, default=1,
+                    help="draw the world at 1/N resolution and upscale it (2: 480x270)")
+    ap.add_argument('--smooth', action='store_true',
+                    help="upscale with smoothing (default: nearest neighbour, which keeps the pixel-art look)")
+    ap.add_argument('--fps', type=int, default=FPS, help=f"render frame cap (0 = uncapped); physics always runs at {PHYSICS_HZ} Hz")
+    ap.add_argument('--record', metavar='DIR', help="save a replay of every level attempt into DIR")
+    ap.add_argument('--replay', metavar='FILE', help="play back a replay file")
+    ap.add_argument('--headless', action='store_true', help="with --replay: run at full speed without a window")
+    ap.add_argument('--selfcheck', action='store_true', help="run the built-in consistency checks and exit")
+    ap.add_argument('--validate', action='store_true',
+                    help="check that each seeded level can be finished; prints one JSON line per level")
+    ap.add_argument('--workers', type=int, default=None,
+                    help="worker processes for --validate (default: 1) and --search (default: all CPUs)")
+    ap.add_argument('--search', metavar='PACK', help="search seeds for solvable levels, appending them to PACK (resumable)")
+    ap.add_argument('--difficulty', type=int, default=10, help="with --search: level difficulty (0-%d)" % MAX_DIFFICULTY)
+    ap.add_argument('--seeds', type=int, default=1000000, help="with --search: number of seeds to try")
+    ap.add_argument('--first-seed', type=int, default=0, help="with --search: first seed")
+    ap.add_argument('--gaps', type=density_range, default=(0.0, 1.0), metavar='MIN:MAX',
+                    help="with --search: pit columns per column")
+    ap.add_argument('--spikes', type=density_range, default=(0.0, 1.0), metavar='MIN:MAX',
+                    help="with --search: spike tiles per column")
+    args = ap.parse_args()
+    if args.dirty_rects and args.downscale != 1:
+        ap.error("--dirty-rects needs --downscale 1 (a downscaled world is redrawn in full)")
+    try:
+        replay = Replay.load(args.replay) if args.replay else None
+    except ValueError as e:
+        sys.exit(f"{args.replay}: {e}")
+    if args.selfcheck:
+        selfcheck()
+    elif args.search:
+        def progress(checked, found, seconds):
+            print(f"\r{checked} seeds, {found} levels, {checked / max(seconds, 1e-9):.0f} seeds/s",
+                  end='', file=sys.stderr, flush=True)
+        try:
+            search_seeds(args.search, args.difficulty, args.seeds, args.first_seed, args.gaps, args.spikes,
+                         args.workers, log=progress)
+        except ValueError as e:
+            sys.exit(str(e))
+        print(file=sys.stderr)
+    elif args.validate:
+        results = validate_levels(args.levels, args.workers)
+        for result in results:
+            print(json.dumps(result))
+        sys.exit(0 if all(r['solvable'] for r in results) else 1)
+    elif replay is not None and args.headless:
+        t0 = time.perf_counter()
+        sim, exact = run_replay(replay)
+        print(json.dumps({'level': replay.level_index + 1, 'ticks': sim.ticks, 'deaths': sim.deaths,
+                          'cleared': sim.cleared, 'exact': exact,
+                          'seconds': round(time.perf_counter() - t0, 4)}))
+        sys.exit(0 if exact else 1)
+    else:
+        main(args.levels, profile=args.profile, trace_path=args.trace, dirty_rects=args.dirty_rects,
+             record_dir=args.record, replay=replay, fps=args.fps, endless=args.endless,
+             downscale=args.downscale, smooth=args.smooth)
@@ -8,24 +8,138 @@ import os
 import sys
 import math
 import random
+import struct
+import threading
 import pygame
+from array import array
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # Mulberry32.fill() falls back to array('d')
+    np = None
 
 # === ULTRA COMPANION FLAMES — CHAOS MODE ENGAGED ===
 SAVE_DIR = os.path.join(os.path.expanduser("~"), ".ultra_mario_chaos")
 os.makedirs(SAVE_DIR, exist_ok=True)
-DEATH_FILE = os.path.join(SAVE_DIR, "deaths.bin")
+DEATH_FILE = os.path.join(SAVE_DIR, "deaths.bin")  # old save: total deaths only, read once to migrate
+SAVE_FILE = os.path.join(SAVE_DIR, "save.bin")
 CHEAT_FILE = os.path.join(SAVE_DIR, "godmode.flag")
 
 # Persist deaths across runs — because pain is eternal
-def load_deaths():
-    if os.path.exists(DEATH_FILE):
-        with open(DEATH_FILE, "rb") as f:
+def load_deaths(path=DEATH_FILE):
+    if os.path.exists(path):
+        with open(path, "rb") as f:
             return int.from_bytes(f.read(4), "little")
     return 0
 
-def save_deaths(count):
-    with open(DEATH_FILE, "wb") as f:
-        f.write(count.to_bytes(4, "little"))
+# save.bin: a header, then one record per world
+SAVE_MAGIC = b"UMSV"
+SAVE_VERSION = 1
+SAVE_HEADER = struct.Struct("<4sHHII")  # magic, version, worlds, total deaths, last world reached
+SAVE_WORLD = struct.Struct("<Id")       # deaths, best clear time in seconds (0 = never cleared)
+SAVE_FLUSH_SECONDS = 5.0                # longest a change waits in memory
+
+class SaveData:
+    # Deaths (total and per world), best clear times and the last world reached, held in
+    # memory and written by a background thread: at most every `interval` seconds while
+    # there are changes, straight away after flush_soon() (level transitions) and on
+    # close() (exit). Each write goes to a temp file renamed over the save, so a crash
+    # mid-write leaves the previous save intact. The frame loop never touches the disk.
+    def __init__(self, worlds=32, path=SAVE_FILE, legacy_path=DEATH_FILE, interval=SAVE_FLUSH_SECONDS):
+        self.path = path
+        self.interval = interval
+        self.deaths = 0
+        self.world_deaths = [0] * worlds
+        self.best_times = [0.0] * worlds
+        self.last_world = 0
+        self.changes = 0   # bumped on every change; `written` is the count last on disk
+        self.written = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        if not self.load():
+            self.deaths = load_deaths(legacy_path)
+        self.thread = threading.Thread(target=self.run, name="save", daemon=True)
+        self.thread.start()
+
+    def load(self):
+        # False when there is no readable save of this version (the caller migrates);
+        # a short or corrupt file counts as missing and leaves nothing half-read
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            magic, version, worlds, deaths, last = SAVE_HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            return False
+        if magic != SAVE_MAGIC or version != SAVE_VERSION:
+            return False
+        if len(data) < SAVE_HEADER.size + worlds * SAVE_WORLD.size:
+            return False
+        world_deaths, best_times = list(self.world_deaths), list(self.best_times)
+        for i in range(min(worlds, len(world_deaths))):
+            world_deaths[i], best_times[i] = SAVE_WORLD.unpack_from(data, SAVE_HEADER.size + i * SAVE_WORLD.size)
+        self.deaths, self.last_world = deaths, last
+        self.world_deaths, self.best_times = world_deaths, best_times
+        return True
+
+    def pack(self):
+        worlds = len(self.world_deaths)
+        parts = [SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, worlds, self.deaths, self.last_world)]
+        parts += [SAVE_WORLD.pack(d, t) for d, t in zip(self.world_deaths, self.best_times)]
+        return b"".join(parts)
+
+    def record_death(self, world):
+        with self.lock:
+            self.deaths += 1
+            self.world_deaths[world] += 1
+            self.changes += 1
+
+    def record_clear(self, world, seconds):
+        with self.lock:
+            if not self.best_times[world] or seconds < self.best_times[world]:
+                self.best_times[world] = seconds
+            self.changes += 1
+
+    def reach_world(self, world):
+        with self.lock:
+            self.last_world = world
+            self.changes += 1
+
+    def flush_soon(self):
+        self.wake.set()
+
+    def flush(self):
+        # write now if anything changed since the last write (background thread, or a
+        # caller that needs the file on disk)
+        with self.lock:
+            if self.changes == self.written:
+                return
+            data, changes = self.pack(), self.changes
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:  # kept in memory; the next flush tries again
+            print("Save failed:", e, file=sys.stderr)
+            return
+        with self.lock:
+            self.written = max(self.written, changes)
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+        self.thread.join()
+        self.flush()
 
 def godmode_active():
     return os.path.exists(CHEAT_FILE)
@@ -57,31 +171,110 @@ BRICK_LIGHT = (248, 120, 88)
 PLAYER_RED = (228, 0, 0)
 PLAYER_SKIN = (252, 152, 56)
 PLAYER_OVERALL = (0, 0, 200)
+QUESTION = (252, 188, 60)
+QUESTION_DARK = (200, 76, 12)
+PIPE_GREEN = (0, 168, 0)
+PIPE_DARK = (0, 88, 0)
+POLE = (220, 220, 220)
+CLOUD = (252, 252, 252)
+KEY = (255, 0, 255)  # colorkey for transparent sprite-sheet pixels
+
+PLAYER_W, PLAYER_H = 28, 48
+
+# === PRNG ===
+# mulberry32, bit-for-bit the reference C (uint32_t) / JS (Math.imul, >>>) generator:
+#   z = (state += 0x6D2B79F5); z = (z ^ z>>15) * (z | 1); z ^= z + (z ^ z>>7) * (z | 61);
+#   return z ^ z>>14
+# with every step wrapped to 32 bits. Draws are that u32 / 2**32, in [0, 1).
+#
+# Seed scheme: world i (0-based) comes from Mulberry32(world_seed(i)), where
+# world_seed(i) = (SEED_MARIO + i * SEED_BROS) mod 2**32. The constants are the ASCII
+# of "MARIO" (its low 32 bits) and "BROS" read big-endian, which is what the old
+# 0xMARIO / 0xBROS literals meant to spell.
+M32 = 0xFFFFFFFF
+MULBERRY_STEP = 0x6D2B79F5
+SEED_MARIO = int.from_bytes(b"MARIO", "big") & M32  # 0x4152494F
+SEED_BROS = int.from_bytes(b"BROS", "big")          # 0x42524F53
+
+def world_seed(i):
+    return (SEED_MARIO + i * SEED_BROS) & M32
+
+class Mulberry32:
+    __slots__ = ('state',)
+
+    def __init__(self, seed):
+        self.state = seed & M32
+
+    def next_u32(self):
+        z = self.state = (self.state + MULBERRY_STEP) & M32
+        z = ((z ^ (z >> 15)) * (z | 1)) & M32
+        z ^= (z + ((z ^ (z >> 7)) * (z | 61))) & M32
+        return z ^ (z >> 14)
+
+    def __call__(self):
+        return self.next_u32() / 4294967296
+
+    def fill(self, n):
+        # the next n draws in one call, the same values n calls would give. The
+        # output is a pure function of the state, which advances by a constant,
+        # so with numpy all n are computed at once in wrapping uint32 arithmetic.
+        start, self.state = self.state, (self.state + n * MULBERRY_STEP) & M32
+        if np is not None:
+            z = np.uint32(start) + np.arange(1, n + 1, dtype=np.uint32) * np.uint32(MULBERRY_STEP)
+            z = (z ^ (z >> 15)) * (z | 1)
+            z ^= z + (z ^ (z >> 7)) * (z | 61)
+            return (z ^ (z >> 14)) / 4294967296.0
+        out = array('d', bytes(8 * n))
+        z0 = start
+        for k in range(n):
+            z0 = (z0 + MULBERRY_STEP) & M32
+            z = ((z0 ^ (z0 >> 15)) * (z0 | 1)) & M32
+            z ^= (z + ((z ^ (z >> 7)) * (z | 61))) & M32
+            out[k] = (z ^ (z >> 14)) / 4294967296
+        return out
+
+# Cross-checked against the C and JS references: the first five u32s per seed.
+MULBERRY32_VECTORS = {
+    0x00000000: (0x4434B462, 0x00159C37, 0x39285B08, 0x256D8104, 0x77A2CBD4),
+    0x00000001: (0xA087EAF3, 0x00B349C9, 0x8706C4EB, 0xFB2627FD, 0xF7E79D2B),
+    0xFFFFFFFF: (0xE57BF3D3, 0x3081A5A4, 0xB7350390, 0xF1ADE904, 0xD8616A2F),
+    world_seed(0): (0x2C876FEA, 0x7821BF33, 0x0D482916, 0x3A6942E2, 0xBB3F9A21),
+    world_seed(1): (0x5D529E52, 0xB39BADFF, 0x38B9114C, 0xFD684239, 0x1F16EB12),
+}
+
+def check_mulberry32():
+    global np
+    for seed, expected in MULBERRY32_VECTORS.items():
+        rng = Mulberry32(seed)
+        got = tuple(rng.next_u32() for _ in expected)
+        assert got == expected, f"seed {seed:#010x}: {[hex(v) for v in got]}"
+        # fill() continues the same stream, with and without numpy
+        saved, draws = np, {}
+        for backend in (saved, None):
+            np = backend
+            rng = Mulberry32(seed)
+            draws[backend is None] = (list(rng.fill(4)) + list(rng.fill(1)) + [rng()], rng.state)
+        np = saved
+        assert draws[True] == draws[False], f"seed {seed:#010x}: fill() backends disagree"
+        assert [round(v * 4294967296) for v in draws[True][0][:5]] == list(expected)
+    return {'vectors': len(MULBERRY32_VECTORS), 'numpy': np is not None}
 
 # === LEVEL GEN (32 worlds, increasing chaos) ===
-def mulberry32(seed):
-    def rng():
-        nonlocal seed
-        seed += 0x6D2B79F5
-        t = seed
-        t = (t ^ (t >> 15)) * (t | 1)
-        t ^= t + (t ^ (t >> 7)) * (t | 61)
-        return ((t ^ (t >> 14)) >> 0) / 4294967296
-    return rng
 
 def generate_smb1_levels():
     levels = []
     for i in range(32):
-        rng = mulberry32(0xMARIO + i * 0xBROS)
+        rng = Mulberry32(world_seed(i))
         w = 120 + i * 6
         h = 15
         grid = [[' ' for _ in range(w)] for _ in range(h)]
 
-        # Ground
-        for x in range(w):
-            grid[h-1][x] = '#'
-            if rng() < 0.15 + i*0.008:
-                grid[h-2][x] = '?'  # question blocks
+        # Ground, and question blocks from one draw per column
+        grid[h-1] = ['#'] * w
+        chance = 0.15 + i*0.008
+        for x, r in enumerate(rng.fill(w)):
+            if r < chance:
+                grid[h-2][x] = '?'
 
         # Clouds & bushes
         for _ in range(3 + i//4):
@@ -101,8 +294,18 @@ def generate_smb1_levels():
             x = int(rng() * (w - 30)) + 15
             y = 5 + int(rng() * 6)
             length = 4 + int(rng() * 8)
+            while 'P' in grid[y+1][x-2:x+length+2] + grid[y+2][x-2:x+length+2]:
+                y -= 1  # two clear rows over and beside a pipe: room to get onto it and walk its top
             grid[y][x:x+length] = ['#'] * length
 
+        # Pits: 2-3 columns of open ground, never beside a pipe or under a low platform
+        for _ in range(1 + i//4):
+            x = int(rng() * (w - 40)) + 20
+            width = 2 + int(rng() * 2)
+            if not any(c in 'P#' for row in grid[h-6:h-1] for c in row[x-2:x+width+2]):
+                for y in (h-2, h-1):
+                    grid[y][x:x+width] = [' '] * width
+
         # Flagpole at end
         flag_x = w - 8
         for y in range(2, h-1):
@@ -123,6 +326,382 @@ def generate_smb1_levels():
         })
     return levels
 
+# === NUMPY GENERATOR BACKEND ===
+# The same worlds built on a (h, w) uint8 array of map characters. Each feature kind
+# takes all its draws in one fill() (x, y, ... interleaved as the loops above draw
+# them, so the stream is unchanged) and is written with masks and slices.
+def generate_smb1_level_array(i):
+    if np is None:
+        raise RuntimeError("generate_smb1_level_array requires numpy")
+    rng = Mulberry32(world_seed(i))
+    w = 120 + i * 6
+    h = 15
+    grid = np.full((h, w), ord(' '), np.uint8)
+
+    # Ground and question blocks
+    grid[h-1] = ord('#')
+    grid[h-2][rng.fill(w) < 0.15 + i*0.008] = ord('?')
+
+    # Clouds: 8 wide
+    d = rng.fill(2 * (3 + i//4))
+    xs = (d[0::2] * (w - 20)).astype(int) + 10
+    ys = 2 + (d[1::2] * 3).astype(int)
+    grid[ys[:, None], xs[:, None] + np.arange(8)] = ord('C')
+
+    # Pipes: 4 wide, from the ground up
+    d = rng.fill(2 * (2 + i//5))
+    xs = (d[0::2] * (w - 20)).astype(int) + 15
+    heights = 2 + (d[1::2] * 3).astype(int)
+    for x, height in zip(xs.tolist(), heights.tolist()):
+        grid[h-height:h-1, x:x+4] = ord('P')
+
+    # Platforms
+    d = rng.fill(3 * (4 + i//3))
+    xs = (d[0::3] * (w - 30)).astype(int) + 15
+    ys = 5 + (d[1::3] * 6).astype(int)
+    lengths = 4 + (d[2::3] * 8).astype(int)
+    for x, y, length in zip(xs.tolist(), ys.tolist(), lengths.tolist()):
+        while (grid[y+1:y+3, x-2:x+length+2] == ord('P')).any():
+            y -= 1  # two clear rows above a pipe
+        grid[y, x:x+length] = ord('#')
+
+    # Pits
+    d = rng.fill(2 * (1 + i//4))
+    xs = (d[0::2] * (w - 40)).astype(int) + 20
+    widths = 2 + (d[1::2] * 2).astype(int)
+    for x, width in zip(xs.tolist(), widths.tolist()):
+        if not np.isin(grid[h-6:h-1, x-2:x+width+2], (ord('P'), ord('#'))).any():
+            grid[h-2:h, x:x+width] = ord(' ')
+
+    # Flagpole
+    flag_x = w - 8
+    grid[2:h-1, flag_x] = ord('|')
+    grid[2, flag_x] = ord('F')
+    return grid
+
+def smb1_level_from_array(i, grid):
+    h, w = grid.shape
+    return {
+        'idx': i,
+        'width': w, 'height': h,
+        'rows': [row.tobytes().decode('ascii') for row in grid],
+        'start': (3, h-3),
+        'exit': (w - 10, h-3)
+    }
+
+def generate_smb1_levels_numpy():
+    return [smb1_level_from_array(i, generate_smb1_level_array(i)) for i in range(32)]
+
+def check_save_data():
+    # deaths stay in memory until a flush; flush_soon() and close() write an atomic,
+    # reloadable record; an old deaths.bin is migrated; a truncated save counts as missing
+    import tempfile, time
+    with tempfile.TemporaryDirectory() as tmp:
+        path, legacy = os.path.join(tmp, "save.bin"), os.path.join(tmp, "deaths.bin")
+        with open(legacy, "wb") as f:
+            f.write((7).to_bytes(4, "little"))
+        save = SaveData(4, path, legacy, interval=60.0)
+        assert save.deaths == 7, "old deaths.bin not migrated"
+        for _ in range(50):
+            save.record_death(1)
+        assert not os.path.exists(path), "deaths were written one by one"
+        save.record_clear(1, 42.5)
+        save.reach_world(2)
+        save.flush_soon()
+        for _ in range(200):
+            if os.path.exists(path):
+                break
+            time.sleep(0.01)
+        assert os.path.exists(path), "flush_soon() did not write"
+        save.record_death(2)
+        save.record_clear(1, 50.0)  # slower: best time kept
+        save.close()
+        assert set(os.listdir(tmp)) == {"deaths.bin", "save.bin"}, "temp file left behind"
+        again = SaveData(4, path, legacy)
+        again.close()
+        assert (again.deaths, again.world_deaths, again.best_times, again.last_world) == \
+            (58, [0, 50, 1, 0], [0.0, 42.5, 0.0, 0.0], 2), "reloaded save differs"
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:SAVE_HEADER.size + SAVE_WORLD.size])  # header intact, records cut short
+        torn = SaveData(4, path, legacy)
+        torn.close()
+        assert (torn.deaths, torn.world_deaths, torn.best_times) == (7, [0] * 4, [0.0] * 4), \
+            "truncated save not treated as missing"
+    return {'bytes': len(data)}
+
+def check_numpy_generator():
+    if np is None:
+        return {'skipped': 'numpy not installed'}
+    assert generate_smb1_levels_numpy() == generate_smb1_levels(), "numpy worlds differ"
+    return {'worlds': 32}
+
+# === TILEMAP ===
+# Ground, bricks/platforms, question blocks and pipes are solid; the flagpole is
+# touched to finish, clouds are scenery. Each level gets its grid flattened once into
+# one solid byte per cell for collision, and per column the non-empty cells for drawing.
+SOLID = bytes(1 if chr(c) in '#?P' else 0 for c in range(256))
+
+def build_tilemap(level):
+    w, h, rows = level['width'], level['height'], level['rows']
+    columns = []
+    for x in range(w):
+        cells = []
+        for y in range(h):
+            ch = rows[y][x]
+            if ch != ' ':
+                cells.append((y * TILE, 'ground' if ch == '#' and y == h-1 else ch))
+        columns.append(tuple(cells))
+    pole = next(x for x in range(w) if rows[h-2][x] == '|')
+    return {'solid': ''.join(rows).encode('ascii').translate(SOLID), 'columns': columns, 'pole': pole}
+
+def tilemap(level):
+    tiles = level.get('tilemap')
+    if tiles is None:
+        tiles = level['tilemap'] = build_tilemap(level)
+    return tiles
+
+def blocked(level, tx, ty0, ty1, vertical=False):
+    # any solid cell in column tx over rows ty0..ty1 (or, vertical, row tx over
+    # columns ty0..ty1); left of the world is a wall, above/below/right is open
+    w, h = level['width'], level['height']
+    solid = level['tilemap']['solid']
+    for t in range(ty0, ty1 + 1):
+        x, y = (t, tx) if vertical else (tx, t)
+        if x < 0 and not vertical:
+            return True
+        if 0 <= x < w and 0 <= y < h and solid[y*w + x]:
+            return True
+    return False
+
+def move_x(player, level, dx):
+    # sweep the leading edge through every tile column it enters and stop flush
+    # against the first solid one, so no frame time can carry the player through
+    x, y = player['x'], player['y']
+    ty0, ty1 = math.floor(y / TILE), math.ceil((y + player['h']) / TILE) - 1
+    if dx > 0:
+        edge = x + player['w']
+        for tx in range(math.ceil(edge / TILE), math.ceil((edge + dx) / TILE)):
+            if blocked(level, tx, ty0, ty1):
+                player['x'], player['vx'] = tx * TILE - player['w'], 0.0
+                return
+    elif dx < 0:
+        for tx in range(math.floor(x / TILE) - 1, math.floor((x + dx) / TILE) - 1, -1):
+            if blocked(level, tx, ty0, ty1):
+                player['x'], player['vx'] = (tx + 1) * TILE, 0.0
+                return
+    player['x'] = x + dx
+
+def move_y(player, level, dy):
+    # as move_x; landing on a tile is what sets on_ground
+    x, y = player['x'], player['y']
+    tx0, tx1 = math.floor(x / TILE), math.ceil((x + player['w']) / TILE) - 1
+    player['on_ground'] = False
+    if dy > 0:
+        edge = y + player['h']
+        for ty in range(math.ceil(edge / TILE), math.ceil((edge + dy) / TILE)):
+            if blocked(level, ty, tx0, tx1, vertical=True):
+                player['y'], player['vy'] = ty * TILE - player['h'], 0.0
+                player['on_ground'] = True
+                return
+    elif dy < 0:
+        for ty in range(math.floor(y / TILE) - 1, math.floor((y + dy) / TILE) - 1, -1):
+            if blocked(level, ty, tx0, tx1, vertical=True):  # head bump
+                player['y'], player['vy'] = (ty + 1) * TILE, 0.0
+                return
+    player['y'] = y + dy
+
+def step_player(player, level, left, right, run, jump, dt):
+    # one frame of SMB1 movement: steer, jump, gravity, then collide
+    # Horizontal
+    target = (WALK_SPEED if not run else RUN_SPEED)
+    accel = 384.0 if player['on_ground'] else 512.0
+    if left and right:
+        player['vx'] *= 0.8
+    elif left:
+        player['vx'] -= accel * dt
+        player['facing'] = -1
+    elif right:
+        player['vx'] += accel * dt
+        player['facing'] = 1
+    else:
+        player['vx'] *= 0.92
+
+    player['vx'] = max(-target*1.3, min(player['vx'], target*1.3))
+
+    # Jump
+    if jump and player['on_ground']:
+        player['vy'] = JUMP_VELOCITY if run else SHORT_JUMP_VELOCITY
+        player['on_ground'] = False
+    if not jump and player['vy'] < -128:
+        player['vy'] += 32  # float cancel
+
+    # Gravity
+    player['vy'] += (GRAVITY if jump and player['vy'] < 0 else GRAVITY + JUMP_GRAVITY_REDUCTION) * dt
+    player['vy'] = min(player['vy'], MAX_FALL)
+
+    # Collision against the level's tiles, one axis at a time
+    move_x(player, level, player['vx'] * dt)
+    move_y(player, level, player['vy'] * dt)
+
+def check_worlds_finishable(hold=6, dt=1.0 / FPS, budget=50000):
+    # every world can be finished with step_player(), and its pits can be fallen into:
+    # a best-first search (furthest right first) over running inputs held for `hold`
+    # frames, states merged on a 4px grid
+    import heapq
+    inputs = [(left, right, True, jump) for left, right in ((False, True), (False, False), (True, False))
+              for jump in (True, False)]
+    worst = falls = 0
+    for level in generate_smb1_levels():
+        pole = tilemap(level)['pole'] * TILE + TILE // 2
+        start = {'x': level['start'][0] * TILE + 8.0, 'y': float((level['start'][1] + 1) * TILE - PLAYER_H),
+                 'w': PLAYER_W, 'h': PLAYER_H, 'vx': 0.0, 'vy': 0.0, 'on_ground': False, 'facing': 1}
+        key = lambda p: (int(p['x'] // 4), int(p['y'] // 4), round(p['vx'] / 20), round(p['vy'] / 50), p['on_ground'])
+        seen, heap, states, finished = {key(start)}, [(-start['x'], 0, start)], 0, False
+        while heap and states < budget and not finished:
+            _, _, p = heapq.heappop(heap)
+            states += 1
+            for held in inputs:
+                q = dict(p)
+                for _ in range(hold):
+                    step_player(q, level, *held, dt)
+                finished = finished or q['x'] + q['w'] > pole
+                if q['y'] > level['height'] * TILE:
+                    falls += 1  # into a pit: a death in the game
+                elif key(q) not in seen:
+                    seen.add(key(q))
+                    heapq.heappush(heap, (-q['x'], len(seen), q))
+        assert finished, f"world {level['idx'] + 1} cannot be finished"
+        worst = max(worst, states)
+    assert falls, "no world has a pit to die in"
+    return {'worlds': 32, 'most states': worst, 'falls': falls}
+
+def draw_tiles(screen, atlas, level, camera_x, top):
+    # only the columns on screen, and in each only its non-empty cells
+    columns = tilemap(level)['columns']
+    first = max(0, int(camera_x // TILE))
+    last = min(level['width'], int((camera_x + WIDTH) // TILE) + 1)
+    for tx in range(first, last):
+        sx = int(tx * TILE - camera_x)
+        for py, name in columns[tx]:
+            atlas.draw(screen, name, sx, top + py)
+
+# === TEXT CACHE ===
+# HUD strings only change on a death or a level change, so rendered text is reused
+# until then; the least recently used surfaces are dropped first.
+class TextCache:
+    def __init__(self, capacity=32):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, colour):
+        key = (font, text, colour)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.surfaces.move_to_end(key)
+            return surf
+        surf = font.render(text, True, colour)
+        self.surfaces[key] = surf
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surf
+
+# === SPRITE ATLAS ===
+# Sprites are drawn once, side by side, onto one colour-keyed sheet at startup and
+# blitted by sub-rect after that. scaled(f) resizes the whole sheet once (nearest
+# neighbour) for other output resolutions.
+def draw_player_sprite(surface, px, py):
+    pygame.draw.rect(surface, (0,0,0), (px-4, py-4, PLAYER_W+8, PLAYER_H+8))
+    pygame.draw.rect(surface, PLAYER_RED, (px, py, PLAYER_W, PLAYER_H))
+    pygame.draw.rect(surface, PLAYER_SKIN, (px+8, py+8, 12, 12))  # face
+    pygame.draw.rect(surface, PLAYER_OVERALL, (px+4, py+24, PLAYER_W-8, 20))
+
+def draw_ground_tile(surface, px, py):
+    pygame.draw.rect(surface, GROUND, (px, py, TILE, TILE))
+    pygame.draw.rect(surface, BRICK_DARK, (px, py, TILE, 3))
+
+def draw_brick_tile(surface, px, py):
+    pygame.draw.rect(surface, BRICK_DARK, (px, py, TILE, TILE))
+    pygame.draw.rect(surface, BRICK_LIGHT, (px+1, py+1, TILE-2, TILE//2-2))
+    pygame.draw.rect(surface, BRICK_LIGHT, (px+1, py+TILE//2+1, TILE//2-2, TILE//2-2))
+    pygame.draw.rect(surface, BRICK_LIGHT, (px+TILE//2+1, py+TILE//2+1, TILE//2-2, TILE//2-2))
+
+def draw_question_tile(surface, px, py):
+    pygame.draw.rect(surface, QUESTION_DARK, (px, py, TILE, TILE))
+    pygame.draw.rect(surface, QUESTION, (px+2, py+2, TILE-4, TILE-4))
+    pygame.draw.rect(surface, QUESTION_DARK, (px+11, py+7, 10, 4))   # ?
+    pygame.draw.rect(surface, QUESTION_DARK, (px+19, py+7, 4, 10))
+    pygame.draw.rect(surface, QUESTION_DARK, (px+14, py+15, 7, 4))
+    pygame.draw.rect(surface, QUESTION_DARK, (px+14, py+22, 4, 4))
+
+def draw_pipe_tile(surface, px, py):
+    pygame.draw.rect(surface, PIPE_DARK, (px, py, TILE, TILE))
+    pygame.draw.rect(surface, PIPE_GREEN, (px+2, py, TILE-4, TILE))
+
+def draw_pole_tile(surface, px, py):
+    pygame.draw.rect(surface, POLE, (px+TILE//2-2, py, 4, TILE))
+
+def draw_flag_tile(surface, px, py):
+    draw_pole_tile(surface, px, py)
+    pygame.draw.polygon(surface, PIPE_GREEN, [(px+TILE//2-2, py+4), (px+2, py+14), (px+TILE//2-2, py+24)])
+
+def draw_cloud_tile(surface, px, py):
+    pygame.draw.ellipse(surface, CLOUD, (px, py+6, TILE, TILE-10))
+
+class SpriteAtlas:
+    SPRITES = (  # name, (w, h), offset of the sprite's corner from the draw position, draw
+        ('player', (PLAYER_W+8, PLAYER_H+8), (-4, -4), draw_player_sprite),
+        # tiles, named by their map character
+        ('ground', (TILE, TILE), (0, 0), draw_ground_tile),
+        ('#', (TILE, TILE), (0, 0), draw_brick_tile),
+        ('?', (TILE, TILE), (0, 0), draw_question_tile),
+        ('P', (TILE, TILE), (0, 0), draw_pipe_tile),
+        ('|', (TILE, TILE), (0, 0), draw_pole_tile),
+        ('F', (TILE, TILE), (0, 0), draw_flag_tile),
+        ('C', (TILE, TILE), (0, 0), draw_cloud_tile),
+    )
+
+    def __init__(self, sheet=None, rects=None, offsets=None, scale=1):
+        if sheet is None:
+            sheet, rects, offsets = self.build()
+        self.sheet, self.rects, self.offsets, self.scale = sheet, rects, offsets, scale
+        self.variants = {scale: self}
+
+    def build(self):
+        sheet = pygame.Surface((sum(size[0] for _, size, _, _ in self.SPRITES),
+                                max(size[1] for _, size, _, _ in self.SPRITES))).convert()
+        sheet.fill(KEY)
+        sheet.set_colorkey(KEY, pygame.RLEACCEL)
+        rects, offsets = {}, {}
+        x = 0
+        for name, (w, h), (ox, oy), draw in self.SPRITES:
+            draw(sheet, x - ox, -oy)
+            rects[name] = pygame.Rect(x, 0, w, h)
+            offsets[name] = (ox, oy)
+            x += w
+        return sheet, rects, offsets
+
+    def draw(self, surface, name, x, y):
+        ox, oy = self.offsets[name]
+        surface.blit(self.sheet, (x + ox, y + oy), self.rects[name])
+
+    def scaled(self, factor):
+        scale = self.scale * factor
+        variant = self.variants.get(scale)
+        if variant is None:
+            edge = lambda v: int(round(v * factor))
+            w, h = self.sheet.get_size()
+            sheet = pygame.transform.scale(self.sheet, (edge(w), edge(h)))
+            sheet.set_colorkey(KEY, pygame.RLEACCEL)
+            rects = {name: pygame.Rect(edge(r.x), edge(r.y), edge(r.right) - edge(r.x), edge(r.bottom) - edge(r.y))
+                     for name, r in self.rects.items()}
+            offsets = {name: (edge(ox), edge(oy)) for name, (ox, oy) in self.offsets.items()}
+            variant = SpriteAtlas(sheet, rects, offsets, scale)
+            variant.variants = self.variants
+            self.variants[scale] = variant
+        return variant
+
 # === MAIN ===
 def main():
     pygame.init()
@@ -130,15 +709,19 @@ def main():
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     clock = pygame.time.Clock()
     font = pygame.font.SysFont("consolas", 32, bold=True)
+    text = TextCache()
+    atlas = SpriteAtlas()
 
     levels = generate_smb1_levels()
     level_idx = 0
-    deaths = load_deaths()
+    save = SaveData(len(levels))
+    deaths = save.deaths
+    level_time = 0.0  # seconds since the current attempt started
     godmode = godmode_active()
 
     player = {
         'x': 100.0, 'y': 200.0,
-        'w': 28, 'h': 48,
+        'w': PLAYER_W, 'h': PLAYER_H,
         'vx': 0.0, 'vy': 0.0,
         'on_ground': False,
         'facing': 1,
@@ -149,11 +732,14 @@ def main():
     state = 'menu'
 
     def reset_level():
-        nonlocal player, camera_x
+        # standing height of the start row, dropped onto whatever is below it
+        nonlocal player, camera_x, level_time
         lvl = levels[level_idx]
+        tilemap(lvl)
+        level_time = 0.0
         player.update({
             'x': lvl['start'][0] * TILE + 8,
-            'y': lvl['start'][1] * TILE,
+            'y': (lvl['start'][1] + 1) * TILE - PLAYER_H,
             'vx': 0, 'vy': 0,
             'on_ground': False
         })
@@ -165,12 +751,13 @@ def main():
 
         for e in pygame.event.get():
             if e.type == pygame.QUIT:
-                save_deaths(deaths)
+                save.close()
                 pygame.quit()
                 sys.exit()
             if e.type == pygame.KEYDOWN:
                 if state == 'menu' and e.key in (pygame.K_z, pygame.K_SPACE):
                     reset_level()
+                    save.reach_world(level_idx)
                     state = 'play'
                 if e.key == pygame.K_F10:  # your private backdoor
                     open(CHEAT_FILE, 'a').close()
@@ -184,85 +771,64 @@ def main():
             run = keys[pygame.K_LSHIFT]
             jump = keys[pygame.K_z] or keys[pygame.K_SPACE]
 
-            # Horizontal
-            target = (WALK_SPEED if not run else RUN_SPEED)
-            accel = 384.0 if player['on_ground'] else 512.0
-            if left and right:
-                player['vx'] *= 0.8
-            elif left:
-                player['vx'] -= accel * dt
-                player['facing'] = -1
-            elif right:
-                player['vx'] += accel * dt
-                player['facing'] = 1
-            else:
-                player['vx'] *= 0.92
-
-            player['vx'] = max(-target*1.3, min(player['vx'], target*1.3))
-
-            # Jump
-            if jump and player['on_ground']:
-                player['vy'] = JUMP_VELOCITY if run else SHORT_JUMP_VELOCITY
-                player['on_ground'] = False
-            if not jump and player['vy'] < -128:
-                player['vy'] += 32  # float cancel
-
-            # Gravity
-            player['vy'] += (GRAVITY if jump and player['vy'] < 0 else GRAVITY + JUMP_GRAVITY_REDUCTION) * dt
-            player['vy'] = min(player['vy'], MAX_FALL)
-
-            # Simple collision (good enough for chaos)
-            player['x'] += player['vx'] * dt
-            player['y'] += player['vy'] * dt
-            player['on_ground'] = player['y'] > HEIGHT - 100
-
-            if player['y'] > HEIGHT + 100:
+            level_time += dt
+            lvl = levels[level_idx]
+            step_player(player, lvl, left, right, run, jump, dt)
+
+            # Camera
+            camera_x = max(0, min(player['x'] - WIDTH // 3, lvl['width'] * TILE - WIDTH))
+
+            if player['y'] > lvl['height'] * TILE + 100:
                 deaths += 1
-                save_deaths(deaths)
+                save.record_death(level_idx)  # written out with the next flush
                 reset_level()
 
-            # Win
-            if player['x'] > levels[level_idx]['width'] * TILE - 200:
+            # Win: reach the flagpole
+            if player['x'] + player['w'] > lvl['tilemap']['pole'] * TILE + TILE // 2:
+                save.record_clear(level_idx, level_time)
                 level_idx += 1
                 if level_idx >= len(levels):
                     state = 'end'
                 else:
+                    save.reach_world(level_idx)
                     reset_level()
-
-            # Camera
-            camera_x = player['x'] - WIDTH // 3
+                save.flush_soon()
 
         # === DRAW ===
+        # the level's bottom row sits on the bottom of the screen
+        lvl = levels[min(level_idx, len(levels) - 1)]
+        top = HEIGHT - lvl['height'] * TILE
         screen.fill(SKY)
-        pygame.draw.rect(screen, GROUND, (0, HEIGHT-80, WIDTH, 80))
+        draw_tiles(screen, atlas, lvl, camera_x, top)
 
         # Player
-        px = int(player['x'] - camera_x)
-        py = int(player['y'])
-        pygame.draw.rect(screen, (0,0,0), (px-4, py-4, player['w']+8, player['h']+8))
-        pygame.draw.rect(screen, PLAYER_RED, (px, py, player['w'], player['h']))
-        pygame.draw.rect(screen, PLAYER_SKIN, (px+8, py+8, 12, 12))  # face
-        pygame.draw.rect(screen, PLAYER_OVERALL, (px+4, py+24, player['w']-8, 20))
+        atlas.draw(screen, 'player', int(player['x'] - camera_x), top + int(player['y']))
 
         # HUD
-        death_txt = font.render(f"DEATHS: {deaths}", True, (255,255,255))
-        level_txt = font.render(f"WORLD {level_idx+1}-1", True, (255,255,255))
+        death_txt = text.render(font, f"DEATHS: {deaths}", (255,255,255))
+        level_txt = text.render(font, f"WORLD {level_idx+1}-1", (255,255,255))
         screen.blit(level_txt, (20, 20))
         screen.blit(death_txt, (20, 60))
 
         if godmode:
-            god_txt = font.render("GODMODE ACTIVE", True, (255, 0, 255))
+            god_txt = text.render(font, "GODMODE ACTIVE", (255, 0, 255))
             screen.blit(god_txt, (WIDTH//2 - god_txt.get_width()//2, 20))
 
         if state == 'menu':
-            title = font.render("SUPER MARIO BROS.", True, (255,255,255))
-            start = font.render("PRESS Z TO BEGIN", True, (255,255,255))
+            title = text.render(font, "SUPER MARIO BROS.", (255,255,255))
+            start = text.render(font, "PRESS Z TO BEGIN", (255,255,255))
             screen.blit(title, (WIDTH//2 - title.get_width()//2, 180))
             screen.blit(start, (WIDTH//2 - start.get_width()//2, 260))
 
         pygame.display.flip()
 
 if __name__ == "__main__":
+    if '--selfcheck' in sys.argv[1:]:
+        print('mulberry32', check_mulberry32())
+        print('numpy-generator', check_numpy_generator())
+        print('save-data', check_save_data())
+        print('worlds-finishable', check_worlds_finishable())
+        sys.exit(0)
     print("ULTRA COMPANION FLAMES — Chaos Engine Online")
     print("Your save dir:", SAVE_DIR)
     main()